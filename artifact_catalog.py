@@ -0,0 +1,155 @@
+import os  # Handy OS functions, explore file directory, etc.
+import json  # Run settings are stored as JSON text
+import sqlite3  # Local catalog, part of the standard library
+from contextlib import closing  # sqlite3's own context manager commits but never closes
+from datetime import datetime  # When runs and artifacts were recorded
+
+## Artifact catalog:
+# Downstream tools used to find outputs by walking the output tree and regex-matching names like
+# 103918_epoch_4_kenMiles_psd_topomap.png. Every run_batch() now records what it wrote in one SQLite file instead:
+#   runs       one row per output directory: its settings and their hash
+#   artifacts  one row per file: run, recording, subject, epoch, event, video, emotion, kind and path (relative to the run)
+# The indexes cover the usual selections, so "epochs 1 and 4 topomaps of 103918 in run X" is an indexed query:
+#   find_artifacts('artifact_catalog.sqlite', run='240930_161302mt_0.6...', subject='103918', epochs=[1, 4], kinds=['topomap'])
+# A recording that is processed again replaces its rows, recordings skipped by an incremental rerun keep theirs.
+
+schema = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    output_directory TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    params_hash TEXT,
+    settings TEXT,
+    created TEXT,
+    updated TEXT
+);
+CREATE TABLE IF NOT EXISTS artifacts (
+    artifact_id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    edf_file TEXT,
+    subject TEXT,
+    epoch INTEGER,
+    event_name TEXT,
+    video TEXT,
+    emotion TEXT,
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL,
+    recorded TEXT,
+    UNIQUE (run_id, path)
+);
+CREATE INDEX IF NOT EXISTS artifacts_subject ON artifacts (subject, epoch, kind);
+CREATE INDEX IF NOT EXISTS artifacts_run ON artifacts (run_id, kind, subject);
+CREATE INDEX IF NOT EXISTS artifacts_recording ON artifacts (run_id, edf_file);
+CREATE INDEX IF NOT EXISTS artifacts_video ON artifacts (video, kind);
+CREATE INDEX IF NOT EXISTS artifacts_emotion ON artifacts (emotion, kind);
+CREATE INDEX IF NOT EXISTS runs_name ON runs (name);
+'''
+
+def connect(catalog_path):
+    ## Open (and create when needed) the catalog
+    connection = sqlite3.connect(catalog_path, timeout=30)
+    connection.row_factory = sqlite3.Row
+    connection.execute('PRAGMA foreign_keys = ON')
+    connection.executescript(schema)
+    return connection
+
+def register_run(catalog_path, output_directory, params_hash=None, settings=None):
+    ## run_id of output_directory, created on first use, its settings updated on every run
+    output_directory = os.path.abspath(output_directory)
+    now = datetime.now().isoformat(timespec='seconds')
+    with closing(connect(catalog_path)) as connection, connection:
+        connection.execute(
+            'INSERT INTO runs (output_directory, name, params_hash, settings, created, updated) VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (output_directory) DO UPDATE SET params_hash = excluded.params_hash, settings = excluded.settings, updated = excluded.updated',
+            (output_directory, os.path.basename(output_directory), params_hash, json.dumps(settings or {}, sort_keys=True, default=str), now, now))
+        return connection.execute('SELECT run_id FROM runs WHERE output_directory = ?', (output_directory,)).fetchone()['run_id']
+
+def record_artifacts(catalog_path, run_id, output_directory, edf_file, artifacts):
+    ## Replace the rows of one recording (artifacts as returned by EEGPipeline.run, empty for a failed recording)
+    now = datetime.now().isoformat(timespec='seconds')
+    edf_name = os.path.basename(edf_file) if edf_file else None
+    rows = [(
+        run_id,
+        edf_name,
+        edf_name[:6] if edf_name else None,  # Same as the output subfolder
+        artifact.get('epoch'),
+        artifact.get('event_name'),
+        artifact.get('video'),
+        artifact.get('emotion'),
+        artifact['kind'],
+        os.path.relpath(artifact['path'], output_directory).replace('\\', '/'),
+        now,
+        ) for artifact in artifacts]
+    with closing(connect(catalog_path)) as connection, connection:
+        if edf_name is None:
+            connection.execute('DELETE FROM artifacts WHERE run_id = ? AND edf_file IS NULL', (run_id,))
+        else:
+            connection.execute('DELETE FROM artifacts WHERE run_id = ? AND edf_file = ?', (run_id, edf_name))
+        connection.executemany(
+            'INSERT OR REPLACE INTO artifacts (run_id, edf_file, subject, epoch, event_name, video, emotion, kind, path, recorded) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    return len(rows)
+
+def in_clause(column, values):
+    return f"{column} IN ({', '.join('?' * len(values))})", list(values)
+
+def find_artifacts(catalog_path, run=None, subject=None, epochs=None, kinds=None, video=None, emotion=None):
+    ## Matching artifacts as dictionaries with the full path, ordered by run, subject and epoch
+    # run is a run_id, an output directory or its folder name, lists select any of their values
+    conditions, parameters = [], []
+    if run is not None:
+        if isinstance(run, int):
+            conditions.append('r.run_id = ?')
+            parameters.append(run)
+        else:
+            conditions.append('(r.output_directory = ? OR r.name = ?)')
+            parameters += [os.path.abspath(run), os.path.basename(os.path.normpath(run))]
+    for column, value in (('a.subject', subject), ('a.epoch', epochs), ('a.kind', kinds), ('a.video', video), ('a.emotion', emotion)):
+        if value is None:
+            continue
+        values = [value] if isinstance(value, (str, int)) else list(value)
+        if column == 'a.epoch':
+            values = [int(epoch) for epoch in values]
+        condition, values = in_clause(column, values)
+        conditions.append(condition)
+        parameters += values
+    query = ('SELECT a.*, r.output_directory, r.name AS run_name FROM artifacts a JOIN runs r ON r.run_id = a.run_id'
+             + (' WHERE ' + ' AND '.join(conditions) if conditions else '')
+             + ' ORDER BY r.run_id, a.subject, a.epoch, a.kind, a.path')
+    with closing(connect(catalog_path)) as connection:
+        rows = [dict(row) for row in connection.execute(query, parameters)]
+    for row in rows:
+        row['path'] = os.path.join(row['output_directory'], row['path'])
+    return rows
+
+def list_runs(catalog_path):
+    with closing(connect(catalog_path)) as connection:
+        return [dict(row) for row in connection.execute(
+            'SELECT r.*, COUNT(a.artifact_id) AS n_artifacts FROM runs r LEFT JOIN artifacts a ON a.run_id = r.run_id GROUP BY r.run_id ORDER BY r.run_id')]
+
+if __name__ == '__main__':
+    # Record two recordings, rerun one of them, and check the selection and that the query uses the indexes
+    import tempfile
+    directory = tempfile.mkdtemp()
+    catalog = os.path.join(directory, 'catalog.sqlite')
+    out = os.path.join(directory, '240930_161302mt_0.6')
+    def artifacts(subject, n_epochs):
+        rows = [{'kind': 'fif', 'path': os.path.join(out, subject, f'{subject}raw.fif'), 'epoch': None}]
+        for epoch in range(1, n_epochs + 1):
+            for kind, suffix in (('spectrum', '_psd.npz'), ('psd_plot', '_psd.png'), ('topomap', '_psd_topomap.png')):
+                rows.append({'kind': kind, 'path': os.path.join(out, subject, f'{subject}_epoch_{epoch}_kenMiles{suffix}'),
+                             'epoch': epoch, 'event_name': 'kenMiles', 'video': 'kenMiles', 'emotion': 'excited'})
+        return rows
+    run_id = register_run(catalog, out, 'abc', {'n_components': 5})
+    record_artifacts(catalog, run_id, out, 'data/103918.edf', artifacts('103918', 5))
+    record_artifacts(catalog, run_id, out, 'data/254362.edf', artifacts('254362', 3))
+    record_artifacts(catalog, run_id, out, 'data/254362.edf', artifacts('254362', 2))  # Reprocessed, fewer epochs now
+    found = find_artifacts(catalog, run='240930_161302mt_0.6', subject='103918', epochs=['1', '4'], kinds=['topomap'])
+    assert [row['epoch'] for row in found] == [1, 4] and found[0]['path'].endswith('103918_epoch_1_kenMiles_psd_topomap.png')
+    assert len(find_artifacts(catalog, subject='254362')) == 1 + 2 * 3
+    assert register_run(catalog, out, 'def') == run_id and list_runs(catalog)[0]['n_artifacts'] == 1 + 5 * 3 + 1 + 2 * 3
+    with closing(connect(catalog)) as connection:
+        plan = ' '.join(row[-1] for row in connection.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM artifacts WHERE subject = '103918' AND epoch IN (1, 4) AND kind = 'topomap'"))
+    assert 'USING INDEX' in plan, plan
+    print('Artifact catalog OK')
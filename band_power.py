@@ -0,0 +1,120 @@
+import warnings  # All-NaN slices (a band with no frequency bins, a lobe with no channels) are expected
+import numpy as np
+
+## Band-power engine:
+# statistics.ipynb filters a to_data_frame() DataFrame by frequency for every lobe / wave pair and calls .describe()
+# per electrode column. Here the spectrum stays a (..., n_channels, n_freqs) array: the bands become a
+# (n_bands, n_freqs) boolean mask, the spectrum is broadcast against it with everything outside the band set to NaN,
+# and every statistic comes out of one NaN-aware reduction over the frequency axis for all bands and electrodes at once.
+# The lobes are a (n_lobes, n_channels) mask applied to those results. Leading axes (e.g. events) are kept, so all
+# equal-length events of a recording can go through in one call.
+
+# Same bands and lobes as statistics.ipynb
+brain_waves = {
+    'Delta': (0.1, 4),
+    'Theta': (4, 8),
+    'Alpha': (8, 13),
+    'Beta Low': (13, 20),
+    'Beta High': (20, 30),
+    'Gamma': (30, 40)
+}
+
+brain_lobes = {
+    'Frontal': ['Fz', 'Fp1', 'F7', 'F3', 'FC1', 'Fp2', 'FC2', 'F4', 'F8'],
+    'Temporal': ['FT9', 'T7', 'FT10', 'T8'],
+    'Parietal': ['Cz', 'C3', 'CP5', 'CP1', 'P3', 'P7', 'Pz', 'P4', 'CP2', 'CP6'],
+    'Occipital': ['PO9', 'O1', 'Oz', 'O2', 'PO10']
+}
+
+# Same columns as the notebook's describe() dictionaries
+stat_names = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+
+def band_masks(freqs, bands=brain_waves):
+    ## (n_bands, n_freqs), True where fmin <= freq <= fmax (inclusive on both ends like the notebook)
+    freqs = np.asarray(freqs)
+    return np.array([(freqs >= fmin) & (freqs <= fmax) for fmin, fmax in bands.values()])
+
+def lobe_masks(ch_names, lobes=brain_lobes):
+    ## (n_lobes, n_channels), electrodes a recording does not have are simply left out
+    return np.array([[channel in electrodes for channel in ch_names] for electrodes in lobes.values()])
+
+def band_statistics(data, freqs, bands=brain_waves):
+    ## Every describe() statistic of every band and electrode, shape (..., n_bands, n_channels, n_stats)
+    data = np.asarray(data, dtype=float)
+    masks = band_masks(freqs, bands)
+    # (..., 1, n_channels, n_freqs) against (n_bands, 1, n_freqs) -> (..., n_bands, n_channels, n_freqs)
+    masked = np.where(masks[:, None, :], data[..., None, :, :], np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        quantiles = np.nanpercentile(masked, [0, 25, 50, 75, 100], axis=-1)  # min, quartiles and max in one pass
+        count = np.broadcast_to(masks.sum(axis=1)[:, None], masked.shape[:-1]).astype(float)
+        statistics = np.stack([
+            count,
+            np.nanmean(masked, axis=-1),
+            np.nanstd(masked, axis=-1, ddof=1),  # Sample standard deviation, like pandas
+            quantiles[0], quantiles[1], quantiles[2], quantiles[3], quantiles[4],
+            ], axis=-1)
+    return statistics
+
+def band_powers(data, freqs, bands=brain_waves):
+    ## Mean power of every channel inside every band, shape (..., n_channels, n_bands)
+    return np.swapaxes(band_statistics(data, freqs, bands)[..., stat_names.index('mean')], -1, -2)
+
+def lobe_means(means, ch_names, lobes=brain_lobes):
+    ## (..., n_bands, n_channels) band means -> (..., n_lobes, n_bands) averaged over each lobe's electrodes
+    lobe_mask = lobe_masks(ch_names, lobes).astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.swapaxes(means @ lobe_mask.T / lobe_mask.sum(axis=1), -1, -2)
+
+def lobe_band_powers(data, freqs, ch_names, bands=brain_waves, lobes=brain_lobes):
+    ## Mean over the lobe's electrodes and the band's frequencies, shape (..., n_lobes, n_bands)
+    # Every electrode has the same number of bins in a band, so this equals the notebook's mean of per-frequency means
+    return lobe_means(band_statistics(data, freqs, bands)[..., stat_names.index('mean')], ch_names, lobes)
+
+def lobe_statistics(statistics, ch_names, bands=brain_waves, lobes=brain_lobes):
+    ## Nested {lobe: {wave: {electrode: {stat: value}}}} from band_statistics(), the notebook's brain_wave_lobes_statistics
+    index = {channel: i for i, channel in enumerate(ch_names)}
+    return {
+        lobe: {
+            wave: {
+                electrode: dict(zip(stat_names, statistics[b, index[electrode]].tolist()))
+                for electrode in electrodes if electrode in index
+                }
+            for b, wave in enumerate(bands)
+            }
+        for lobe, electrodes in lobes.items()
+        }
+
+def event_band_features(spectrum_data, freqs, ch_names, bands=brain_waves, lobes=brain_lobes):
+    ## Everything stored with an event's spectrum: per-electrode statistics, band powers and lobe band powers
+    statistics = band_statistics(spectrum_data, freqs, bands)
+    means = statistics[..., stat_names.index('mean')]
+    return {
+        'band_statistics': statistics,
+        'band_powers': np.swapaxes(means, -1, -2),
+        'lobe_band_powers': lobe_means(means, ch_names, lobes),
+        }
+
+if __name__ == '__main__':
+    # Check against the pandas loops of statistics.ipynb on a random spectrum
+    import pandas as pd
+    rng = np.random.default_rng(0)
+    ch_names = [channel for electrodes in brain_lobes.values() for channel in electrodes] + ['FC5']
+    freqs = np.linspace(1, 40, 157)
+    data = rng.random((len(ch_names), len(freqs)))
+    df = pd.DataFrame(data.T, columns=ch_names)
+    df['freq'] = freqs
+    nested = lobe_statistics(band_statistics(data, freqs), ch_names)
+    lobe_powers = lobe_band_powers(data, freqs, ch_names)
+    for l, (lobe, electrodes) in enumerate(brain_lobes.items()):
+        for b, (wave, (min_freq, max_freq)) in enumerate(brain_waves.items()):
+            rows = df[(df['freq'] >= min_freq) & (df['freq'] <= max_freq)][electrodes]
+            assert np.isclose(rows.mean(axis=1).mean(), lobe_powers[l, b])
+            for col in rows.columns:
+                desc = rows[col].describe(percentiles=[.25, .5, .75])
+                for stat in stat_names:
+                    assert np.isclose(desc[stat], nested[lobe][wave][col][stat]), (lobe, wave, col, stat)
+    # Leading axes: a stack of events gives the same numbers as one event at a time
+    events = rng.random((3, len(ch_names), len(freqs)))
+    assert np.allclose(band_statistics(events, freqs)[1], band_statistics(events[1], freqs))
+    print('Band-power engine OK')
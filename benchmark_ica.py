@@ -0,0 +1,96 @@
+ica_methods = ['fastica', 'picard', 'infomax', 'infomax-extended'] # Backends to compare, see ica_fitting.ica_methods
+output_directory = 'ica_benchmarks'
+description = f'ica_{"-".join(ica_methods)}'
+import os  # Handy OS functions, explore file directory, etc.
+import csv  # Results table
+import warnings  # Catch the convergence warnings the backends raise
+import numpy as np
+from datetime import datetime  # To time & date stamp output files as needed
+import export_all_events as pipeline  # Preprocessing (and its cache), ICA settings, thresholds
+from ica_fitting import fit_ica, component_stability  # Same fitting code the pipeline uses
+
+## ICA backend benchmark:
+# Every backend is fitted on the SAME preprocessed recording with the pipeline's settings (components, max_iter,
+# sample budget, decimation, rejection), then scored for EOG and muscle artifacts with the pipeline's thresholds.
+# One CSV row per recording and backend: wall time, iterations, convergence, the exclusion sets and how closely
+# its components match the first backend's.
+
+def benchmark_method(raw, method):
+    ## Fit one backend and score it, returns (row, fitted ICA)
+    ica = pipeline.make_ica(method)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        fit_seconds, fitted_seconds = fit_ica(
+            ica, raw, pipeline.eeg_channels,
+            budget = pipeline.ica_sample_budget,
+            decim = pipeline.ica_decim,
+            reject = pipeline.ica_reject,
+            tstep = pipeline.ica_tstep,
+            stratify = pipeline.ica_stratify,
+            )
+    convergence_warnings = [str(w.message) for w in caught if 'converge' in str(w.message).lower()]
+    n_iter = int(ica.n_iter_)
+    eog_indices, _ = ica.find_bads_eog(raw, ch_name=pipeline.eog_channels, threshold=pipeline.eog_threshold, measure="zscore", verbose=False)
+    muscle_indices, _ = ica.find_bads_muscle(inst=raw, threshold=pipeline.muscle_threshold, verbose=False)
+    row = {
+        'method': method,
+        'fit_seconds': round(fit_seconds, 3),
+        'fitted_seconds': round(fitted_seconds, 1),
+        'n_iter': n_iter,
+        'max_iter': pipeline.ica_max_iter,
+        'converged': not convergence_warnings and n_iter < pipeline.ica_max_iter,
+        'eog_indices': ' '.join(map(str, sorted(eog_indices))),
+        'muscle_indices': ' '.join(map(str, sorted(muscle_indices))),
+        'excluded': ' '.join(map(str, sorted(set(eog_indices) | set(muscle_indices)))),
+        'error': '',
+        }
+    return row, ica
+
+def benchmark_recording(edf_file):
+    raw = pipeline.load_and_preprocess(edf_file)
+    rows = []
+    reference = None  # First backend that fits, the others are compared against it
+    for method in ica_methods:
+        print(f"Fitting {method} on {edf_file}")
+        try:
+            row, ica = benchmark_method(raw, method)
+        except Exception as e:  # e.g. python-picard not installed
+            print(f"{method} failed on {edf_file}: {e}")
+            rows.append({'edf_file': edf_file, 'method': method, 'error': str(e)})
+            continue
+        if reference is None:
+            reference = (method, ica)
+        correlations, _ = component_stability(ica, reference[1])
+        row.update({'reference': reference[0], 'mean_match': round(float(np.mean(correlations)), 3), 'worst_match': round(float(np.min(correlations)), 3)})
+        print(f"    {row['fit_seconds']:.2f}s, {row['n_iter']} iterations, converged: {row['converged']}, excluded: [{row['excluded']}]")
+        rows.append({'edf_file': edf_file, **row})
+    return rows
+
+def save_results(rows, path):
+    fieldnames = ['edf_file', 'method', 'fit_seconds', 'fitted_seconds', 'n_iter', 'max_iter', 'converged',
+                  'eog_indices', 'muscle_indices', 'excluded', 'reference', 'mean_match', 'worst_match', 'error']
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Saved ICA benchmark to {path}")
+
+def main(parent_directory, output_directory):
+    rows = []
+    for edf_file in pipeline.find_edf_files(parent_directory):
+        try:
+            rows.extend(benchmark_recording(edf_file))
+        except Exception as e:
+            print(f"Error benchmarking {edf_file}: {e}")
+    if rows:
+        save_results(rows, os.path.join(output_directory, 'ica_benchmark.csv'))
+    return rows
+
+if __name__ == '__main__':
+    parent_directory = r'emotion_data\103918'
+
+    # Create a timestamped subfolder in the output directory
+    timestamp = datetime.now().strftime('%y%m%d_%H%M%S')
+    timestamped_output_directory = os.path.join(output_directory, pipeline.sanitize_filename(timestamp + description))
+    os.makedirs(timestamped_output_directory, exist_ok=True)
+    main(parent_directory, timestamped_output_directory)
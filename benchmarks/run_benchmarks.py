@@ -0,0 +1,114 @@
+durations = [600, 1800] # Seconds per synthetic recording
+n_subjects = 2 # Recordings generated and processed per duration
+fixture_directory = 'benchmark_fixtures' # Synthetic EDFs are written once and reused by later runs
+output_directory = 'benchmark_results'
+baseline_file = None # Results CSV of an earlier run (e.g. 'benchmark_results/baseline.csv'), stages that got slower are flagged
+regression_tolerance = 1.25 # A stage is a regression when it takes this many times longer than in the baseline ...
+regression_min_seconds = 0.5 # ... and at least this much longer, so tiny stages do not flag on noise
+pipeline_settings = dict(
+    use_preprocessed_cache=False, # Always measure reading and filtering
+    use_ica_cache=False, # Always measure the ICA fit
+    report_channels=False,
+    )
+import os  # Handy OS functions, explore file directory, etc.
+import sys  # The pipeline lives one folder up
+import csv  # Results table
+import time  # Total time per recording
+import tempfile  # Pipeline outputs are thrown away, only the timings matter
+from datetime import datetime  # To time & date stamp output files as needed
+benchmark_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [benchmark_directory, os.path.join(benchmark_directory, '..')]
+from eeg_pipeline import EEGPipeline  # The pipeline every export script uses
+from stage_metrics import report_columns, report_values  # Same columns as the run report
+from synthetic_edf import make_recording  # EMOTIV-shaped EDF+ fixtures
+
+## Offline benchmark:
+# Generates n_subjects synthetic EMOTIV-shaped recordings per duration (only once, they are deterministic per seed),
+# runs each through EEGPipeline with the caches off and writes one CSV row per recording and stage with the run report's
+# columns (wall time, CPU time and memory, see stage_metrics.py). With baseline_file set, every stage's mean wall time per
+# duration is compared to the baseline and slower stages are printed as regressions (the script then exits with status 1).
+
+def fixture_path(duration, subject):
+    return os.path.join(fixture_directory, f'synthetic_{duration}s_{subject:02d}.edf')
+
+def ensure_fixtures():
+    ## Write the fixtures that do not exist yet
+    paths = []
+    for duration in durations:
+        for subject in range(n_subjects):
+            path = fixture_path(duration, subject)
+            if not os.path.exists(path):
+                print(f"Generating {path}")
+                make_recording(path, duration, seed=duration * 1000 + subject)
+            paths.append((duration, subject, path))
+    return paths
+
+def benchmark_recording(pipeline, path):
+    ## Run one recording into a scratch folder, returns (seconds, stage metrics)
+    with tempfile.TemporaryDirectory() as scratch_directory:
+        start_time = time.perf_counter()
+        artifacts = pipeline.run(path, scratch_directory)
+        seconds = time.perf_counter() - start_time
+    if artifacts is None:
+        raise RuntimeError(f"Pipeline failed on {path}")
+    return seconds, pipeline.metrics.stages
+
+def benchmark_rows(fixtures):
+    pipeline = EEGPipeline(**pipeline_settings)
+    rows = []
+    for duration, subject, path in fixtures:
+        print(f"Benchmarking {path}")
+        seconds, stages = benchmark_recording(pipeline, path)
+        print(f"    {seconds:.1f}s total, {duration / seconds:.0f}x real time")
+        for stage, entry in {**stages, 'total': {'calls': 1, 'wall_seconds': seconds}}.items():
+            rows.append({'duration': duration, 'subject': subject, 'stage': stage, **dict(zip(report_columns, report_values(entry)))})
+    return rows
+
+def save_rows(rows, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Saved benchmark results to {path}")
+
+def mean_wall_times(rows):
+    ## (duration, stage) -> mean wall seconds over the subjects
+    totals = {}
+    for row in rows:
+        key = (int(row['duration']), row['stage'])
+        totals.setdefault(key, []).append(float(row['wall_seconds']))
+    return {key: sum(values) / len(values) for key, values in totals.items()}
+
+def find_regressions(rows, baseline_rows):
+    ## Stages that got slower than the baseline by more than the tolerance
+    current, baseline = mean_wall_times(rows), mean_wall_times(baseline_rows)
+    regressions = []
+    for key, seconds in sorted(current.items()):
+        if key in baseline and seconds > baseline[key] * regression_tolerance and seconds - baseline[key] > regression_min_seconds:
+            regressions.append((*key, baseline[key], seconds))
+    return regressions
+
+def print_summary(rows):
+    for (duration, stage), seconds in sorted(mean_wall_times(rows).items()):
+        print(f"    {duration:>6}s recording  {stage:<12} {seconds:8.2f}s")
+
+def main():
+    os.makedirs(output_directory, exist_ok=True)
+    rows = benchmark_rows(ensure_fixtures())
+    timestamp = datetime.now().strftime('%y%m%d_%H%M%S')
+    save_rows(rows, os.path.join(output_directory, f'benchmark_{timestamp}.csv'))
+    print('Mean wall time per stage:')
+    print_summary(rows)
+    if baseline_file:
+        with open(baseline_file, newline='') as f:
+            regressions = find_regressions(rows, list(csv.DictReader(f)))
+        for duration, stage, before, after in regressions:
+            print(f"REGRESSION: {stage} on {duration}s recordings {before:.2f}s -> {after:.2f}s")
+        if not regressions:
+            print(f"No regressions against {baseline_file}")
+        return regressions
+    return []
+
+if __name__ == '__main__':
+    if main():
+        sys.exit(1)
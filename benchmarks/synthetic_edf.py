@@ -0,0 +1,173 @@
+import os  # Handy OS functions, explore file directory, etc.
+import math  # Annotation signal size
+from datetime import datetime  # Recording start in the header
+import numpy as np
+
+## Synthetic EMOTIV-shaped recordings:
+# write_edf() is a small EDF+ writer (numpy only, no MNE / edfio / pyedflib) and make_recording() fills it with a layout
+# like the EMOTIV exports in emotion_data: timestamp and counter channels, the 32 EEG channels, headset status flags,
+# CQ.* contact quality, EQ.* signal quality and MOT.* motion channels, all at 128 Hz, plus video / rating annotations
+# written the way the experiment software writes them (videos\<category> <emotion>\...\<video>.mp4,...,-1,1).
+# The EEG is a mixture of a few sources (alpha, blinks on the frontal channels, temporal muscle bursts, 1/f noise)
+# so ICA and the EOG / muscle scoring have something realistic to work on.
+
+sfreq = 128
+eeg_channels = ['Cz', 'Fz', 'Fp1', 'F7', 'F3', 'FC1', 'C3', 'FC5', 'FT9', 'T7', 'CP5', 'CP1', 'P3', 'P7', 'PO9', 'O1', 'Pz', 'Oz', 'O2', 'PO10', 'P8', 'P4', 'CP2', 'CP6', 'T8', 'FT10', 'FC6', 'C4', 'FC2', 'F4', 'F8', 'Fp2']
+timing_channels = ['TimestampS', 'TimestampMs', 'OrTimestampS', 'OrTimestampMs', 'Counter', 'Interpolated']
+status_channels = ['HighBitFlex', 'SaturationFlag', 'RawCq', 'Battery', 'BatteryPercent', 'MarkerHardware']
+quality_channels = ['CQ.' + channel for channel in eeg_channels] + ['CQ.Overall', 'EQ.SampleRateQua', 'EQ.OVERALL'] + ['EQ.' + channel for channel in eeg_channels]
+motion_channels = ['MOT.TimestampS', 'MOT.TimestampMs', 'MOT.OrTimestampS', 'MOT.OrTimestampM', 'MOT.CounterMems', 'MOT.Interpolated',
+                   'MOT.Q0', 'MOT.Q1', 'MOT.Q2', 'MOT.Q3', 'MOT.AccX', 'MOT.AccY', 'MOT.AccZ', 'MOT.MagX', 'MOT.MagY', 'MOT.MagZ']
+
+videos = [
+    r'videos\1 excited\1 motorsports\kenMiles.mp4',
+    r'videos\2 sad\1 farewell\lastGoodbye.mp4',
+    r'videos\3 calm\2 nature\mountainLake.mkv',
+    r'videos\4 fear\1 horror\darkHallway.mp4',
+    r'videos\5 happy\3 animals\puppies.mp4',
+    r'videos\neutralVideo.mp4',
+]
+
+def header_field(value, width):
+    ## Left-justified, space-padded ASCII field
+    text = value if isinstance(value, str) else f'{value:g}'
+    if len(text) > width:
+        raise ValueError(f"{text!r} does not fit in an EDF header field of {width} characters")
+    return text.ljust(width).encode('ascii')
+
+def annotation_records(annotations, n_records, record_duration):
+    ## Time-stamped annotation lists (TALs) of every data record, as bytes
+    records = [[f'+{i * record_duration:g}\x14\x14\x00'.encode('latin-1')] for i in range(n_records)]
+    for onset, duration, description in annotations:
+        record = min(int(onset // record_duration), n_records - 1)
+        duration_text = f'\x15{duration:g}' if duration else ''
+        records[record].append(f'+{onset:g}{duration_text}\x14{description}\x14\x00'.encode('latin-1'))
+    return [b''.join(parts) for parts in records]
+
+def write_edf(path, signals, labels, sfreq, annotations=(), units=None, physical_ranges=None, start=None, record_duration=1):
+    ## Write an EDF+C file: signals is (n_channels, n_times) in physical units, annotations are (onset, duration, description)
+    n_channels, n_times = signals.shape
+    samples_per_record = int(round(sfreq * record_duration))
+    n_records = math.ceil(n_times / samples_per_record)
+    padded = np.zeros((n_channels, n_records * samples_per_record))
+    padded[:, :n_times] = signals
+    units = units or ['uV'] * n_channels
+    physical_ranges = physical_ranges or [(-8192, 8192)] * n_channels
+    start = start or datetime(2024, 1, 1, 12, 0, 0)
+
+    tals = annotation_records(annotations, n_records, record_duration)
+    n_annotation_samples = max(math.ceil(max(len(tal) for tal in tals) / 2), 30)
+
+    n_signals = n_channels + 1  # + EDF Annotations
+    header = b''.join([
+        header_field('0', 8),
+        header_field('X X X Synthetic', 80),
+        header_field(f"Startdate {start.strftime('%d-%b-%Y').upper()} X X X", 80),
+        header_field(start.strftime('%d.%m.%y'), 8),
+        header_field(start.strftime('%H.%M.%S'), 8),
+        header_field(str(256 * (n_signals + 1)), 8),
+        header_field('EDF+C', 44),
+        header_field(str(n_records), 8),
+        header_field(record_duration, 8),
+        header_field(str(n_signals), 4),
+        ])
+    # Signal headers are stored field by field: every label, then every transducer type, ...
+    all_labels = list(labels) + ['EDF Annotations']
+    columns = [
+        (all_labels, 16),
+        ([''] * n_signals, 80),
+        (list(units) + [''], 8),
+        ([low for low, high in physical_ranges] + [-1], 8),
+        ([high for low, high in physical_ranges] + [1], 8),
+        ([-32768] * n_signals, 8),
+        ([32767] * n_signals, 8),
+        ([''] * n_signals, 80),
+        ([str(samples_per_record)] * n_channels + [str(n_annotation_samples)], 8),
+        ([''] * n_signals, 32),
+        ]
+    header += b''.join(header_field(value, width) for values, width in columns for value in values)
+
+    # Physical -> 16-bit digital values
+    low = np.array([low for low, high in physical_ranges], dtype=float)[:, None]
+    high = np.array([high for low, high in physical_ranges], dtype=float)[:, None]
+    digital = np.clip(np.round((padded - low) / (high - low) * 65535 - 32768), -32768, 32767).astype('<i2')
+    digital = digital.reshape(n_channels, n_records, samples_per_record).transpose(1, 0, 2)  # Record-major
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(header)
+        for i in range(n_records):
+            f.write(digital[i].tobytes())
+            f.write(tals[i].ljust(n_annotation_samples * 2, b'\x00'))
+    return path
+
+def video_annotations(duration, video_seconds=70, rating_seconds=15, first_onset=10):
+    ## Video / rating annotation pairs filling the recording, descriptions formatted like the experiment writes them
+    annotations = []
+    onset, i = first_onset, 0
+    while onset + video_seconds + rating_seconds < duration:
+        video = videos[i % len(videos)]
+        annotations.append((onset, 0, f'{video},{video},-1,1'))
+        annotations.append((onset + video_seconds, 0, 'rating'))
+        onset += video_seconds + rating_seconds
+        i += 1
+    return annotations
+
+def pink_noise(rng, n_channels, n_times):
+    ## 1/f noise, shaped in the frequency domain
+    spectrum = np.fft.rfft(rng.standard_normal((n_channels, n_times)), axis=1)
+    freqs = np.fft.rfftfreq(n_times, 1 / sfreq)
+    spectrum[:, 1:] /= np.sqrt(freqs[1:])
+    spectrum[:, 0] = 0
+    noise = np.fft.irfft(spectrum, n=n_times, axis=1)
+    return noise / noise.std(axis=1, keepdims=True)
+
+def synthetic_eeg(rng, n_times):
+    ## (32, n_times) EEG in uV: alpha, blinks, muscle and background noise mixed onto the channels
+    times = np.arange(n_times) / sfreq
+    alpha = np.sin(2 * np.pi * 10 * times) * (1 + 0.5 * np.sin(2 * np.pi * 0.1 * times))
+    blinks = np.zeros(n_times)
+    for onset in np.cumsum(rng.exponential(4.0, size=int(n_times / sfreq / 2) + 1)):
+        if onset * sfreq >= n_times:
+            break
+        blinks += np.exp(-0.5 * ((times - onset) / 0.08) ** 2)
+    muscle = rng.standard_normal(n_times) * (rng.random(n_times // sfreq + 1).repeat(sfreq)[:n_times] > 0.8)
+    muscle = np.convolve(muscle, [1, -1], mode='same')  # Mostly high frequency
+    index = {channel: i for i, channel in enumerate(eeg_channels)}
+    mixing = np.zeros((len(eeg_channels), 3))
+    mixing[:, 0] = [1.0 if channel.startswith(('O', 'P')) else 0.3 for channel in eeg_channels]  # Alpha, occipital / parietal
+    mixing[:, 1] = [1.0 if channel in ('Fp1', 'Fp2') else 0.4 if channel in ('F7', 'F8', 'F3', 'F4', 'Fz') else 0.05 for channel in eeg_channels]  # Blinks
+    mixing[[index['T7'], index['T8'], index['FT9'], index['FT10']], 2] = 1.0  # Temporal muscle
+    sources = np.stack([alpha * 10, blinks * 150, muscle * 20])
+    return mixing @ sources + pink_noise(rng, len(eeg_channels), n_times) * 5
+
+def make_recording(path, duration, seed=0, start=None):
+    ## Write one EMOTIV-shaped EDF+ of duration seconds to path
+    rng = np.random.default_rng(seed)
+    n_times = int(duration * sfreq)
+    times = np.arange(n_times) / sfreq
+    signals, labels, ranges, units = [], [], [], []
+    def add(names, data, value_range, unit=''):
+        signals.extend(data)
+        labels.extend(names)
+        ranges.extend([value_range] * len(names))
+        units.extend([unit] * len(names))
+    add(timing_channels, [times % 1e5, (times * 1000) % 1000, times % 1e5, (times * 1000) % 1000, np.arange(n_times) % 128, np.zeros(n_times)], (0, 1e5))
+    add(eeg_channels, synthetic_eeg(rng, n_times), (-8192, 8192), 'uV')
+    add(status_channels, [np.zeros(n_times)] * 3 + [np.full(n_times, 4), np.full(n_times, 80), np.zeros(n_times)], (0, 255))
+    add(quality_channels, [np.full(n_times, 4.0)] * len(quality_channels), (0, 255))
+    add(motion_channels, [rng.standard_normal(n_times) * 0.1 for _ in motion_channels], (-100, 100))
+    return write_edf(path, np.array(signals), labels, sfreq, video_annotations(duration), units, ranges, start)
+
+if __name__ == '__main__':
+    # Round trip through MNE: layout, data and annotations must come back intact
+    import tempfile
+    import mne
+    path = make_recording(os.path.join(tempfile.mkdtemp(), 'synthetic.edf'), 300, seed=1)
+    raw = mne.io.read_raw_edf(path, preload=True, verbose=False)
+    expected = timing_channels + eeg_channels + status_channels + quality_channels + motion_channels
+    assert raw.ch_names == expected, 'channel layout differs'
+    assert raw.info['sfreq'] == sfreq and raw.n_times == 300 * sfreq
+    assert list(raw.annotations.description[:2]) == [video_annotations(300)[0][2], 'rating']
+    assert 1 < np.std(raw.get_data(picks=['Cz'])) * 1e6 < 200
+    print(f'Synthetic EDF OK: {len(expected)} channels, {len(raw.annotations)} annotations')
@@ -0,0 +1,120 @@
+relative_path = './all_events/240930_161302mt_0.6eogt_4db_True_nrmlizd_True_cmp_5' # Output folder of an export run
+prefix = '103918' # The first set of numbers, None combines every recording in the folder
+epoch_list = ['1', '4'] # Epochs to include, in this order
+source = 'spectra' # 'spectra' draws the grid from the stored *_psd.npz files, 'png' stacks the existing PNGs
+filter_keyword = None # Only PNGs whose name contains this, e.g. 'topomap' (source = 'png' only)
+dB = True
+normalize = True # Topomaps show each band's share of the channel's total power
+catalog_path = 'artifact_catalog.sqlite' # Look the files up in the pipeline's artifact catalog, folders it does not know are searched instead
+import os  # Handy OS functions, explore file directory, etc.
+import re  # Epoch number out of the filenames
+import glob  # Find the stored spectra / PNGs
+import numpy as np
+import mne  # The main eeg package / library
+import matplotlib  # Headless backend, the grid is only ever saved
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from PIL import Image  # PNG stacking
+from event_spectra import load_event_spectrum  # Per-event spectra with their band powers
+from artifact_catalog import find_artifacts  # Indexed lookup of the files a run wrote
+
+## Combined figures:
+# combine_images.ipynb walks the output folder for PNGs, opens every one of them at once and pastes them into one tall
+# canvas, so memory grows with the number of epochs and their resolution. Here the grid is DRAWN from the per-event
+# spectra the pipeline stores (*_psd.npz): one row per selected epoch with its PSD and one topomap per band (the stored
+# band powers, no Welch and no PNG decoding), in a single figure that is saved once.
+# For folders without stored spectra, source = 'png' stacks the PNGs instead: only the image headers are read to size the
+# canvas, then the images are opened and pasted one at a time, so at most one of them is decoded at any moment.
+# Runs recorded in the artifact catalog are looked up there (one indexed query), older folders are searched with glob.
+
+epoch_pattern = re.compile(r'_epoch_(\d+)_')
+
+def find_files(base_path, prefix, epochs, suffix, filter_keyword=None):
+    ## Files of the selected epochs ending in suffix, ordered like epochs
+    name = f'{prefix}_epoch_*' if prefix else '*_epoch_*'
+    found = []
+    for path in glob.glob(os.path.join(base_path, '**', name + suffix), recursive=True):
+        match = epoch_pattern.search(os.path.basename(path))
+        if match and match.group(1) in epochs and (filter_keyword is None or filter_keyword in os.path.basename(path)):
+            found.append(path)
+    return sorted(found, key=lambda path: (epochs.index(epoch_pattern.search(os.path.basename(path)).group(1)), path))
+
+def catalog_files(base_path, prefix, epochs, kinds, filter_keyword=None):
+    ## Same selection as find_files() from the artifact catalog, empty when the run is not catalogued
+    if not catalog_path or not os.path.exists(catalog_path):
+        return []
+    rows = find_artifacts(catalog_path, run=base_path, subject=prefix, epochs=epochs, kinds=kinds)
+    paths = [row['path'] for row in rows if filter_keyword is None or filter_keyword in os.path.basename(row['path'])]
+    return sorted(paths, key=lambda path: (epochs.index(epoch_pattern.search(os.path.basename(path)).group(1)), path))
+
+def topomap_info(ch_names, freqs):
+    ## Channel info with 10-20 positions, the sampling rate only has to be above twice the highest frequency
+    info = mne.create_info(list(ch_names), sfreq=max(128.0, 2 * float(freqs[-1]) + 1), ch_types='eeg')
+    info.set_montage(mne.channels.make_standard_montage('standard_1020'), on_missing='ignore')
+    return info
+
+def draw_spectra_grid(paths, output_path, dB=True, normalize=True):
+    ## One row per stored spectrum: PSD of every channel, then a topomap of every band, saved as one figure
+    spectra = [load_event_spectrum(path) for path in paths]
+    band_names = [str(band) for band in spectra[0]['band_names']]
+    n_rows, n_columns = len(spectra), 1 + len(band_names)
+    fig, axes = plt.subplots(n_rows, n_columns, figsize=(4 + 2 * len(band_names), 2.6 * n_rows),
+                             gridspec_kw={'width_ratios': [3] + [1] * len(band_names)}, squeeze=False)
+    for row, (path, spectrum) in enumerate(zip(paths, spectra)):
+        freqs, data = spectrum['freqs'], spectrum['data'].astype(float)
+        axes[row, 0].plot(freqs, 10 * np.log10(data.T * 1e12) if dB else data.T * 1e12, linewidth=0.6)
+        axes[row, 0].set_title(f"{os.path.basename(path)[:6]} epoch {epoch_pattern.search(os.path.basename(path)).group(1)}: {spectrum['event_name']}", fontsize=9, loc='left')
+        axes[row, 0].set_ylabel('µV²/Hz (dB)' if dB else 'µV²/Hz', fontsize=8)
+        if row == n_rows - 1:
+            axes[row, 0].set_xlabel('Frequency (Hz)', fontsize=8)
+        powers = spectrum['band_powers'].astype(float)  # (n_channels, n_bands)
+        if normalize:
+            powers = powers / powers.sum(axis=1, keepdims=True)
+        info = topomap_info(spectrum['ch_names'], freqs)
+        for b, band in enumerate(band_names):
+            mne.viz.plot_topomap(powers[:, b], info, axes=axes[row, b + 1], show=False, cmap='Spectral_r', contours=6, sensors=True)
+            if row == 0:
+                axes[row, b + 1].set_title(band, fontsize=9)
+    fig.tight_layout()
+    fig.savefig(output_path)
+    plt.close(fig)
+    print(f'Combined figure saved to {output_path}')
+    return output_path
+
+def stack_images(paths, output_path):
+    ## Paste PNGs below each other, decoding one at a time
+    sizes = []
+    for path in paths:
+        with Image.open(path) as img:  # Header only, the pixels are not decoded yet
+            sizes.append(img.size)
+    canvas = Image.new('RGB', (max(width for width, height in sizes), sum(height for width, height in sizes)), 'white')
+    top = 0
+    for path, (width, height) in zip(paths, sizes):
+        with Image.open(path) as img:
+            canvas.paste(img.convert('RGB'), (0, top))
+        top += height
+    canvas.save(output_path)
+    print(f'Combined image saved to {output_path}')
+    return output_path
+
+def main(relative_path, epoch_list, prefix=None, source='spectra', filter_keyword=None):
+    base_path = os.path.abspath(relative_path)
+    if source == 'spectra':
+        paths = catalog_files(base_path, prefix, epoch_list, ['spectrum']) or find_files(base_path, prefix, epoch_list, '_psd.npz')
+    else:
+        paths = catalog_files(base_path, prefix, epoch_list, ['psd_plot', 'topomap', 'ica_overlay'], filter_keyword) or find_files(base_path, prefix, epoch_list, '.png', filter_keyword)
+        paths = [path for path in paths if not os.path.basename(path).startswith('combined_')]
+    if not paths:
+        print(f"No {'stored spectra' if source == 'spectra' else 'PNG files'} found for epochs {epoch_list} in {base_path}")
+        return None
+    name = prefix or 'all'
+    output_dir = os.path.join(base_path, name)
+    os.makedirs(output_dir, exist_ok=True)
+    suffix = f'_{filter_keyword}' if source != 'spectra' and filter_keyword else ''
+    output_file = os.path.join(output_dir, f"combined_{source}_{name}_epochs_{'-'.join(epoch_list)}{suffix}.png")
+    if source == 'spectra':
+        return draw_spectra_grid(paths, output_file, dB=dB, normalize=normalize)
+    return stack_images(paths, output_file)
+
+if __name__ == '__main__':
+    main(relative_path, epoch_list, prefix, source, filter_keyword)
@@ -0,0 +1,72 @@
+import os  # Handy OS functions, explore file directory, etc.
+import mne  # The main eeg package / library
+
+## Include-only EDF loading:
+# Instead of a hand-maintained exclude list of every EMOTIV auxiliary channel (TimestampS, CQ.*, EQ.*, MOT.*...),
+# the channels to keep are given explicitly. The EDF header is scanned once (only the header bytes are read) to
+# check they are all there and to report what is skipped, then MNE is asked to decode just those signals.
+# A firmware update that adds channels therefore costs nothing.
+
+annotation_labels = ('EDF Annotations', 'BDF Annotations')  # Always read by MNE for the annotations, never skipped
+
+def read_edf_header(edf_file):
+    ## Channel labels, samples per record and record count straight from the EDF/BDF header
+    with open(edf_file, 'rb') as f:
+        fixed = f.read(256)
+        n_channels = int(fixed[252:256].decode('ascii').strip())
+        signal_header = f.read(n_channels * 256)
+    def field(offset, width):
+        ## One fixed-width field for every channel, the header stores them column by column
+        start = n_channels * offset
+        return [signal_header[start + i * width:start + (i + 1) * width].decode('latin-1').strip() for i in range(n_channels)]
+    return {
+        'labels': field(0, 16),
+        'samples_per_record': [int(value) for value in field(16 + 80 + 8 * 5 + 80, 8)],
+        'n_records': int(fixed[236:244].decode('ascii').strip()),
+        'record_duration': float(fixed[244:252].decode('ascii').strip()),
+        'bytes_per_sample': 3 if fixed[:1] == b'\xff' else 2,  # BDF (BioSemi) stores 24-bit samples, EDF 16-bit
+    }
+
+def scan_channels(edf_file, include):
+    ## Which header channels are kept and skipped, and how many bytes of signal that saves
+    header = read_edf_header(edf_file)
+    record_bytes = [n * header['bytes_per_sample'] * header['n_records'] for n in header['samples_per_record']]
+    kept, skipped = [], []
+    kept_bytes = skipped_bytes = 0
+    for label, n_bytes in zip(header['labels'], record_bytes):
+        if label in include or label in annotation_labels:
+            kept.append(label)
+            kept_bytes += n_bytes
+        else:
+            skipped.append(label)
+            skipped_bytes += n_bytes
+    missing = [channel for channel in include if channel not in header['labels']]
+    return {'kept': kept, 'skipped': skipped, 'missing': missing, 'kept_bytes': kept_bytes, 'skipped_bytes': skipped_bytes}
+
+def print_channel_report(edf_file, report):
+    total = report['kept_bytes'] + report['skipped_bytes']
+    print(f"Header scan of {os.path.basename(edf_file)}: keeping {len(report['kept'])} channels, skipping {len(report['skipped'])}")
+    print(f"    Decoding {report['kept_bytes'] / 1e6:.1f} MB of {total / 1e6:.1f} MB, {report['skipped_bytes'] / 1e6:.1f} MB saved")
+    if report['skipped']:
+        print(f"    Skipped: {', '.join(report['skipped'])}")
+
+def read_channels(edf_file, include, lazy=True, report=True):
+    ## Read only the channels in include, in that order
+    channel_report = scan_channels(edf_file, include)
+    if report:
+        print_channel_report(edf_file, channel_report)
+    if channel_report['missing']:
+        raise ValueError(f"{edf_file} has no channel(s) {', '.join(channel_report['missing'])}")
+    raw = mne.io.read_raw_edf(
+        edf_file,
+        include=list(include),  # Everything else in the file is never decoded
+        misc=None, # List of channel names to be considered as miscellaneous (MISC) channels.
+        stim_channel=None,  # Set to None if you don't have a stim channel
+        preload=not lazy,  # Lazy: keep the data on disk until the channels are in the right order
+        infer_types=True,  # Infer channel types from names
+        verbose=False  # Set verbosity / output messages
+        )
+    raw.pick(list(include))  # Same channel order as include
+    if lazy:
+        raw.load_data(verbose=False)
+    return raw
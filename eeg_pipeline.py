@@ -0,0 +1,591 @@
+import os  # Handy OS functions, explore file directory, etc.
+import re  # To sanitize filename
+import glob  # Useful to grab the EDF files easily
+import time  # Stage and batch timing
+import mne  # The main eeg package / library
+import matplotlib  # Needed to switch workers to a headless backend
+import matplotlib.pyplot as plt  # Use as backend when needed
+from concurrent.futures import ProcessPoolExecutor, as_completed  # Fan recordings out to a pool of processes
+from mne.preprocessing import ICA  # Import it explicitly to minimize required code and refer to it more easily
+from event_spectra import save_event_spectrum, event_windows, compute_event_spectra, event_raw  # Batched per-event spectra, saved with their band powers
+from gfp import stream_gfp, save_gfp  # Chunked Global Field Power of the cleaned recording
+from microstates import fit_recording_microstates, save_microstates  # Microstate maps fitted at the GFP peaks, backfitted
+from windowing import write_windows, window_table_path  # Fixed-interval windows in one memory-mapped .npy
+from artifact_catalog import register_run, record_artifacts  # SQLite catalog of everything a run writes
+from feature_table import ica_metadata, event_feature_row, save_feature_table, recordings_in_table  # One feature table per run for the ML side
+from edf_loader import read_channels  # Include-only EDF reading driven by eeg_channels
+from event_table import recording_event_table, select_events, event_rows  # Columnar event table, parsed once per recording
+from render_pool import shared_render_pool, render_psd, render_topomap  # Draw PSD and topomap PNGs in worker processes, one pool per process
+from pipeline_cache import ica_cache_path, load_cached_ica, save_cached_ica  # Skip refitting ICA on reruns
+from pipeline_cache import preprocessed_cache_path, load_preprocessed, save_preprocessed  # Skip reading and filtering on reruns
+from pipeline_cache import settings_hash  # Hash of the output settings for the incremental manifest
+from ica_fitting import fit_ica, component_stability, print_stability, ica_method_arguments  # Bounded-budget ICA fitting
+from stage_metrics import StageMetrics, write_run_report  # Wall / CPU time and memory per stage, run report
+from run_manifest import manifest_path, manifest_key, load_manifest, save_manifest, is_complete, make_entry  # Incremental reruns
+
+## Shared preprocessing pipeline:
+# export_all_events.py, split_files_for_every_event.py, export_time_window.py, export_preprocessed_data_and_plots.py
+# and generate_plots_and_fifs/main.py used to carry their own copy of generate_plots(). They are now thin configurations
+# of EEGPipeline, which runs one recording through explicit stages:
+#   load (include-only EDF read + pick) -> montage -> reference -> filter   (cached together as the preprocessed recording)
+#   ica (fit, cached) -> find_bads (score EOG / muscle components) -> apply_ica -> segment -> psd / gfp -> microstates -> save / render
+# Every stage is measured (pipeline.metrics, see stage_metrics.py), run_batch() handles the process pool, incremental reruns
+# and writes the run report and the feature table (feature_table.py) of the events of every recording (pipeline.features).
+# Every artifact is recorded in the SQLite catalog (artifact_catalog.py) so downstream tools query it instead of walking the tree.
+
+default_settings = {
+    'eeg_channels': ['Cz', 'Fz', 'Fp1', 'F7', 'F3', 'FC1', 'C3', 'FC5', 'FT9', 'T7', 'CP5', 'CP1', 'P3', 'P7', 'PO9', 'O1', 'Pz', 'Oz', 'O2', 'PO10', 'P8', 'P4', 'CP2', 'CP6', 'T8', 'FT10', 'FC6', 'C4', 'FC2', 'F4', 'F8', 'Fp2'],
+    'eog_channels': ['Fp1', 'Fp2'],
+    'muscle_threshold': 0.6,
+    'eog_threshold': 4,
+    'apply_proj': False,
+    'plot_psd': True,
+    'plot_ica_overlay': False,
+    'plot_topomap': True,
+    'dB': True,
+    'normalize': True,
+    'n_components': 5,
+    'l_freq': 1.0,
+    'h_freq': 40,
+    'ica_method': 'fastica',
+    'ica_random_state': 97,
+    'ica_max_iter': 800,
+    'ica_tstep': 2,
+    'ica_sample_budget': None,
+    'ica_decim': None,
+    'ica_reject': None,
+    'ica_stratify': True,
+    'ica_compare_full': False,
+    'use_ica_cache': True,
+    'ica_cache_directory': 'ica_cache',
+    'use_preprocessed_cache': True,
+    'preprocessed_cache_directory': 'preprocessed_cache',
+    'save_fif': True,
+    'event_regexp': None,  # Only annotations matching this (mne.events_from_annotations regexp), None keeps them all
+    'window_mode': 'offset',  # 'offset': event_length seconds starting event_offset after the marker, 'annotation': marker to next annotation
+    'event_offset': 15,
+    'event_length': 44,
+    'max_events': None,  # Stop after this many events per recording, None processes them all
+    'save_spectrum': True,
+    'spectrum_format': 'npz',
+    'save_gfp': False,  # Opt in (export_all_events.py does): GFP trace, windowed averages and per-event GFP statistics / peaks of every recording
+    'gfp_chunk_seconds': 60,  # Seconds of the cleaned recording read at a time to compute GFP
+    'gfp_window_seconds': 3,  # Fixed window of the windowed GFP averages
+    'save_microstates': False,  # Opt in (export_all_events.py does): microstate maps, backfitted labels and per-event coverage / occurrence / duration
+    'microstate_states': 4,
+    'microstate_restarts': 10,  # Modified k-means restarts, all run together, the best GEV is kept
+    'microstate_max_peaks': 5000,  # At most this many GFP peak maps are clustered per recording, None uses them all
+    'microstate_random_state': 97,
+    'save_windows': False,  # Every window_interval seconds of the cleaned recording in one <file>_windows.npy plus its window table
+    'window_interval': 2,
+    'window_overlap': 0,  # Seconds shared by consecutive windows
+    'save_features': True,  # One row per recording x event in the run's feature table
+    'feature_table_format': 'parquet',  # 'parquet', 'hdf5' or 'csv', falls back to the next one when its writer is not installed
+    'lazy_load': True,
+    'report_channels': True,
+    'mne_n_jobs': 1,
+    'render_workers': 2,
+    'render_queue_size': 8,
+    'incremental': False,
+    'catalog_path': 'artifact_catalog.sqlite',  # Every run records its artifacts here (see artifact_catalog.py), None disables it
+}
+
+def sanitize_filename(filename):
+
+    print(f'filename:{filename}')
+    ### Sanitize the filename to remove or replace invalid characters
+    return re.sub(r'[\\/*?:"<>|,]', '_', filename)
+
+def save_script_copy(script_path, output_directory, description):
+    ## Save a copy of the script in the output directory
+    sanitized_description = sanitize_filename(description)
+    script_name = os.path.basename(script_path).replace('.py', f'_{sanitized_description}.py')
+    output_path = os.path.join(output_directory, script_name)
+    with open(script_path, 'r') as original_script:
+        with open(output_path, 'w') as copy_script:
+            copy_script.write(original_script.read())
+    print(f"Saved a copy of the script to {output_path}")
+
+def script_settings(namespace):
+    ## The pipeline settings a script defines as module globals, e.g. script_settings(globals())
+    return {name: value for name, value in namespace.items() if name in default_settings}
+
+def find_edf_files(parent_directory):  # Self explanatory, let's grab every EDF file and process it
+    extensions = ['*.bdf', '*.edf', '*.edf+']
+    edf_files = []
+    for ext in extensions:
+        edf_files.extend(glob.glob(os.path.join(parent_directory, '**', ext), recursive=True))
+    return edf_files
+
+class EEGPipeline:
+    ## One recording at a time through the stages above, settings are default_settings overridden by keyword
+    def __init__(self, **settings):
+        unknown = set(settings) - set(default_settings)
+        if unknown:
+            raise ValueError(f"Unknown pipeline setting(s): {', '.join(sorted(unknown))}")
+        self.settings = {**default_settings, **settings}
+        self.__dict__.update(self.settings)  # self.eog_threshold etc.
+        if self.window_mode not in ('offset', 'annotation'):
+            raise ValueError(f"window_mode must be 'offset' or 'annotation', not {self.window_mode!r}")
+        self.metrics = StageMetrics()
+        self.features = []
+
+    def timed(self, stage, function, *args, **kwargs):
+        ## Run one stage and add its wall time, CPU time and memory to self.metrics
+        return self.metrics.measure(stage, function, *args, **kwargs)
+
+    def preprocess_settings(self):
+        ## Everything that changes the filtered, referenced data, used as part of the cache keys
+        return {
+            'eeg_channels': self.eeg_channels,
+            'reference': 'average',
+            'apply_proj': self.apply_proj,
+            'l_freq': self.l_freq,
+            'h_freq': self.h_freq,
+            'mne_version': mne.__version__,
+            }
+
+    def ica_settings(self):
+        ## Everything that changes the fitted ICA, plotting flags like dB or normalize do not
+        return {
+            **self.preprocess_settings(),
+            'n_components': self.n_components,
+            'method': self.ica_method,
+            'random_state': self.ica_random_state,
+            'max_iter': self.ica_max_iter,
+            'tstep': self.ica_tstep,
+            'sample_budget': self.ica_sample_budget,
+            'decim': self.ica_decim,
+            'reject': self.ica_reject,
+            'stratify': self.ica_stratify,
+            }
+
+    def output_settings(self):
+        ## Everything that changes what ends up in the output folder, hashed into the incremental manifest
+        ignored = ('use_ica_cache', 'ica_cache_directory', 'use_preprocessed_cache', 'preprocessed_cache_directory',
+                   'lazy_load', 'report_channels', 'mne_n_jobs', 'render_workers', 'render_queue_size', 'incremental', 'ica_compare_full',
+                   'save_features', 'feature_table_format', 'catalog_path')  # The feature table is rebuilt from the rows of every run, see run_batch()
+        return {**{name: value for name, value in self.settings.items() if name not in ignored}, 'mne_version': mne.__version__}
+
+    ## Preprocessing stages
+
+    def load(self, edf_file):
+        # Only the channels in eeg_channels are decoded, the header scan reports what was skipped (CQ.*, EQ.*, MOT.*...)
+        return read_channels(edf_file, self.eeg_channels, lazy=self.lazy_load, report=self.report_channels)
+
+    def set_montage(self, raw):
+        montage = mne.channels.make_standard_montage('standard_1020')  # Define the locations
+        raw.set_montage(montage, on_missing='ignore')  # Set locations and handle error
+        # raw.set_montage(montage, on_missing='raise') # Set locations and handle error
+        return raw
+
+    def reference(self, raw):
+        raw.set_eeg_reference(
+            ref_channels = "average",
+            projection = self.apply_proj,  # Use same settings globally
+            #projection=True,
+            ch_type = "eeg",
+            # ch_type = "auto",
+            # forward = None,
+            # joint = False,
+            verbose = False
+            )# Set EEG average reference
+        if self.apply_proj: # Use same settings globally
+            raw.apply_proj()
+        return raw
+
+    def filter(self, raw):
+        raw.filter(
+            l_freq=self.l_freq,
+            h_freq=self.h_freq,
+            picks=self.eeg_channels,
+            n_jobs = self.mne_n_jobs, # Per-worker budget, see n_workers
+            verbose = False,
+            ) # Apply bandpass filter
+        return raw
+
+    def preprocess(self, edf_file):
+        ## Read the EDF, keep the EEG channels, set the montage, re-reference and band-pass filter
+        raw = self.timed('load', self.load, edf_file)
+        raw = self.timed('montage', self.set_montage, raw)
+        raw = self.timed('reference', self.reference, raw)
+        return self.timed('filter', self.filter, raw)
+
+    def load_and_preprocess(self, edf_file):
+        ## Preprocessed recording from the cache when available, otherwise preprocess the EDF (and cache the result)
+        if not self.use_preprocessed_cache:
+            return self.preprocess(edf_file)
+        cache_path = preprocessed_cache_path(self.preprocessed_cache_directory, edf_file, self.preprocess_settings())
+        raw = self.timed('load_cached', load_preprocessed, cache_path)
+        if raw is not None:
+            print(f"Loaded preprocessed recording from {cache_path}.npy")
+            return raw
+        raw = self.preprocess(edf_file)
+        self.timed('cache', save_preprocessed, raw, cache_path)
+        return raw
+
+    ## ICA stages
+
+    def make_ica(self, method=None):
+        # Set up ICA, method defaults to ica_method
+        return ICA(
+            # n_components=30,
+            n_components=self.n_components,
+            #noise_cov =
+            **ica_method_arguments(method or self.ica_method),  # method= and fit_params= of the chosen backend
+            random_state=self.ica_random_state,
+            max_iter=self.ica_max_iter,
+            # max_iter="auto",
+            )
+
+    def fit_ica(self, raw, edf_file):
+        ## Fit ICA on the preprocessed recording, or load it from the cache when nothing relevant changed
+        ica_path = ica_cache_path(self.ica_cache_directory, edf_file, self.ica_settings()) if self.use_ica_cache else None
+        ica = load_cached_ica(ica_path) if self.use_ica_cache else None
+        if ica is not None:
+            print(f"Loaded cached ICA from {ica_path}")
+            return ica
+        ica = self.make_ica()
+        # Fit on a bounded, evenly spread sample of the recording when ica_sample_budget is set (see ica_fitting.py)
+        fit_seconds, fitted_seconds = fit_ica(
+            ica, raw, self.eeg_channels,
+            budget = self.ica_sample_budget,
+            decim = self.ica_decim,
+            reject = self.ica_reject,
+            tstep = self.ica_tstep,
+            stratify = self.ica_stratify,
+            # reject_by_annotation = True,
+            )
+        print(f"Fitted ICA in {fit_seconds:.1f}s on {fitted_seconds:.0f}s of the {raw.times[-1]:.0f}s recording")
+        if self.ica_compare_full and self.ica_sample_budget is not None:  # How much do the components move compared to a full fit?
+            full_ica = self.make_ica()
+            full_seconds, _ = fit_ica(full_ica, raw, self.eeg_channels, decim=self.ica_decim, reject=self.ica_reject, tstep=self.ica_tstep)
+            correlations, matches = component_stability(ica, full_ica)
+            print_stability(correlations, matches, fit_seconds, full_seconds)
+        if self.use_ica_cache:
+            save_cached_ica(ica, ica_path)
+        return ica
+
+    def find_bads(self, raw, ica):
+        ## Indices of the EOG and muscle components
+        # Find EOG and muscle artifacts
+        eog_indices, eog_scores = ica.find_bads_eog(
+            raw,
+            ch_name=self.eog_channels,
+            threshold = self.eog_threshold,
+            measure = "zscore",
+            verbose = False
+            )  # Define EOG indicies and scores
+
+        muscle_noise_indices, muscle_noise_scores = ica.find_bads_muscle(
+            inst= raw,
+            threshold = self.muscle_threshold,
+            # start: Any | None = None,
+            # stop: Any | None = None,
+            # l_freq: int = 7,
+            # h_freq: int = 45,
+            # sphere: Any | None = None,
+            verbose= False
+            )
+        return list(set(eog_indices + muscle_noise_indices))
+
+    def clean(self, raw, ica):
+        ## Exclude the EOG and muscle components and apply ICA to a copy of the recording
+        # Exclude the identified artifact components
+        ica.exclude = self.timed('find_bads', self.find_bads, raw, ica) # NOTE: This excludes a lot!  Can set this to be more or less
+        return self.timed('apply_ica', ica.apply, raw.copy(), verbose=False)
+
+    ## Event stages
+
+    def segment(self, raw_clean):
+        ## (event table rows, [start, stop) sample windows) of the selected events
+        table = recording_event_table(raw_clean)  # Every event at the sample mne.events_from_annotations puts it
+        selected = select_events(table, self.event_regexp)[:self.max_events]  # Same selection events_from_annotations(regexp=...) makes
+        if self.window_mode == 'offset':
+            windows = event_windows(table['sample'][selected], raw_clean, self.event_offset, self.event_length)
+        else:  # From the marker to the next annotation (or the end of the recording)
+            sfreq = raw_clean.info['sfreq']
+            windows = [(int(table['sample'][i]), min(int(round(table['next_onset'][i] * sfreq)) + 1, raw_clean.n_times)) for i in selected]
+        return event_rows(table, selected), windows
+
+    def psd(self, raw_clean, windows):
+        ## (Spectrum, band / lobe powers) of every window, one Welch and one band-power call per window length
+        # Welch stays in this process like the original per-event compute_psd: the windows are short, and starting mne_n_jobs
+        # joblib workers for one batched call costs more than it saves
+        return compute_event_spectra(raw_clean, windows, self.eeg_channels, fmin=1, fmax=40)
+
+    def gfp(self, raw_clean):
+        ## GFP of the cleaned EEG channels, streamed gfp_chunk_seconds at a time
+        return stream_gfp(raw_clean, self.eeg_channels, self.gfp_chunk_seconds)
+
+    def microstates(self, raw_clean, gfp, windows, table, path):
+        ## Fit the microstate maps on the GFP peaks, backfit them and save them with their per-event statistics
+        templates, gev, labels, peaks = fit_recording_microstates(
+            raw_clean, self.eeg_channels, gfp,
+            n_states = self.microstate_states,
+            n_restarts = self.microstate_restarts,
+            max_peaks = self.microstate_max_peaks,
+            chunk_seconds = self.gfp_chunk_seconds,
+            random_state = self.microstate_random_state,
+            )
+        return save_microstates(path, templates, self.eeg_channels, gev, labels, peaks, raw_clean.info['sfreq'], windows, [event['label'] for event in table])
+
+    ## Output stages
+
+    def save_raw(self, raw_clean, path, start=0, stop=None):
+        ## NOTE: ML & AI TEAM pay attention here
+        raw_clean.save(# Writes just [start, stop] straight from the cleaned buffer, no per-event copy
+            path,
+            picks=None,
+            tmin=start,
+            tmax=stop,
+            buffer_size_sec=None,
+            drop_small_buffer=False,
+            proj=self.apply_proj, # Use same settings globally
+            fmt='single',
+            overwrite=self.incremental, # Incremental reruns replace the outputs of a changed recording
+            split_size='2GB',
+            split_naming='neuromag',
+            verbose=False
+            )
+
+    def save_ica_overlay(self, ica, raw, window, event_name, path):
+        try: # NOTE: Failure causes raised exception!!
+            ica_fig = ica.plot_overlay(
+                event_raw(raw, window), # Only this event's samples, before cleaning
+                # exclude=ica.exclude,
+                picks=self.eeg_channels,
+                title = event_name,
+                show=False,
+                # n_pca_components = 32,
+                )# on_baseline = None
+            ica_fig.savefig(path)
+            plt.close(ica_fig)  # Close the figure to free up memory
+            return True
+        except Exception as e:
+            print(e)
+            return False
+
+    def run(self, edf_file, output_directory):
+        ## Whole pipeline for one recording, returns the list of artifacts written ({'kind', 'path', 'epoch'}) or None on failure
+        self.metrics = StageMetrics()
+        self.features = []  # Feature table rows of this recording
+        artifacts = []
+        try:
+            raw = self.load_and_preprocess(edf_file)
+            ica = self.timed('ica', self.fit_ica, raw, edf_file)
+            raw_clean = self.clean(raw, ica)
+
+            base_name = os.path.basename(edf_file).replace('.edf', '').replace('.bdf', '')
+            # Determine subfolder based on the first 6 characters of the filename
+            subfolder_path = os.path.join(output_directory, os.path.basename(edf_file)[:6])
+            os.makedirs(subfolder_path, exist_ok=True)
+
+            ##NOTE: Write the COMPLETE raw fif
+            if self.save_fif:
+                fif_output_path = os.path.join(subfolder_path, f"{base_name}raw.fif")
+                self.timed('save', self.save_raw, raw_clean, fif_output_path)
+                artifacts.append({'kind': 'fif', 'path': fif_output_path, 'epoch': None})
+
+            # Parse every distinct description once and lay the events out as a table, then cut out their windows
+            table, windows = self.timed('segment', self.segment, raw_clean)
+            sfreq = raw_clean.info['sfreq']
+            for event, window in zip(table, windows):  # Start and stop of the window that is cropped, analysed and saved
+                start, stop = (f"{window[0] / sfreq:.2f}s", f"{(window[1] - 1) / sfreq:.2f}s") if window is not None else ('after the end', 'after the end')
+                print(f"Start Event: {event['name']}, Stop Event: {event['stop_event_name']}, Start: {start}, Stop: {stop}")
+            spectra, event_features = self.timed('psd', self.psd, raw_clean, windows)
+            if self.save_gfp or self.save_microstates:
+                gfp = self.timed('gfp', self.gfp, raw_clean)
+            if self.save_gfp:
+                gfp_output_path = os.path.join(subfolder_path, f"{base_name}_gfp.npz")
+                self.timed('save', save_gfp, gfp_output_path, gfp, sfreq, windows, [event['label'] for event in table], self.gfp_window_seconds)
+                artifacts.append({'kind': 'gfp', 'path': gfp_output_path, 'epoch': None})
+            if self.save_microstates:
+                microstate_output_path = os.path.join(subfolder_path, f"{base_name}_microstates.npz")
+                self.timed('microstates', self.microstates, raw_clean, gfp, windows, table, microstate_output_path)
+                artifacts.append({'kind': 'microstates', 'path': microstate_output_path, 'epoch': None})
+            if self.save_windows:
+                windows_output_path = os.path.join(subfolder_path, f"{base_name}_windows.npy")
+                self.timed('save', write_windows, raw_clean, self.eeg_channels, windows_output_path, self.window_interval, self.window_overlap, table, self.gfp_chunk_seconds)
+                artifacts.append({'kind': 'windows', 'path': windows_output_path, 'epoch': None})
+                artifacts.append({'kind': 'window_table', 'path': window_table_path(windows_output_path), 'epoch': None})
+            ica_columns = ica_metadata(ica)
+
+            # Figures are rendered in the background and all written before we return, the render processes stay up for the next recording
+            renderer = shared_render_pool(self.render_workers, self.render_queue_size)
+            failed = 0
+            try:
+                for i, (event, window) in enumerate(zip(table, windows)):
+                    event_name = event['label']  # Video name, non-video events (e.g. rating) keep their first word
+                    if window is None:  # The window starts after the recording ends
+                        print(f"Skipping epoch {i + 1} ({event_name}), it starts after the end of {edf_file}")
+                        continue
+                    start, stop = window[0] / sfreq, (window[1] - 1) / sfreq
+                    # Window runs past the end of the recording and was cut short, compared in samples (event_windows() adds the +1
+                    # of crop's inclusive tmax) since the float seconds of a full window can come out a hair short
+                    if self.window_mode == 'offset' and window[1] - window[0] < int(round(self.event_length * sfreq)) + 1:
+                        event_name = event_name + str(start) + 'shortened'
+                        print(f"Epoch {i + 1} runs past the end of {edf_file}, shortened to end at {stop:.2f}s")
+                    prefix = os.path.join(subfolder_path, f"{base_name}_epoch_{i + 1}_{sanitize_filename(event_name)}")
+                    epoch_fields = {'epoch': i + 1, 'event_name': event_name, 'video': event['video'], 'emotion': event['emotion']}  # Catalogued with every artifact of the epoch
+                    spectrum, features = spectra[i], event_features[i]  # Computed ONCE above, the PSD plot, topomap, saved spectrum and feature row all reuse them
+
+                    if self.save_spectrum:
+                        spectrum_output_path = f"{prefix}_psd.{self.spectrum_format}"
+                        self.timed('save', save_event_spectrum, spectrum, spectrum_output_path, features, event_name=event_name, start=start, stop=stop)
+                        artifacts.append({'kind': 'spectrum', 'path': spectrum_output_path, **epoch_fields})
+                    if self.save_features:
+                        self.features.append(event_feature_row(edf_file, i + 1, event, event_name, start, stop, features, spectrum.ch_names, ica_columns))
+                    if self.plot_psd:
+                        psd_output_path = f"{prefix}_psd.png"
+                        self.timed('render_wait', renderer.submit, render_psd, spectrum.get_data(), spectrum.freqs, spectrum.info, psd_output_path, dB=self.dB)
+                        artifacts.append({'kind': 'psd_plot', 'path': psd_output_path, **epoch_fields})
+                    if self.plot_ica_overlay:
+                        ica_output_path = f"{prefix}_ica_overlay.png"
+                        if self.timed('ica_overlay', self.save_ica_overlay, ica, raw, window, event_name, ica_output_path):
+                            artifacts.append({'kind': 'ica_overlay', 'path': ica_output_path, **epoch_fields})
+                    ##NOTE: ML & AI Team, please pay close attention here
+                    if self.save_fif:
+                        fif_output_path = f"{prefix}raw.fif"
+                        self.timed('save', self.save_raw, raw_clean, fif_output_path, start, stop)
+                        artifacts.append({'kind': 'event_fif', 'path': fif_output_path, **epoch_fields})
+                    if self.plot_topomap:
+                        topo_output_path = f"{prefix}_psd_topomap.png"
+                        self.timed('render_wait', renderer.submit, render_topomap, spectrum.get_data(), spectrum.freqs, spectrum.info, event_name, topo_output_path, normalize=self.normalize)
+                        artifacts.append({'kind': 'topomap', 'path': topo_output_path, **epoch_fields})
+            finally:
+                # render_wait is what this process spent handing figures over and waiting for them, render_workers the drawing
+                # itself as timed in the render processes (with render_workers = 0 both measure the same inline drawing)
+                failed, drawn = self.timed('render_wait', renderer.drain)
+                if drawn['calls']:
+                    self.metrics.add('render_workers', drawn['wall_seconds'], drawn['cpu_seconds'], drawn['calls'])
+            if failed:  # Figures that could not be drawn count as a failed recording
+                print(f"{failed} figures failed to render for {edf_file}")
+                return None
+
+        except Exception as e:
+            print(f"Error processing {edf_file}: {e}")
+            return None
+        return artifacts
+
+## Batches of recordings
+
+def init_worker():
+    ## Runs once in every pool process before it picks up a recording
+    matplotlib.use('Agg')  # Headless backend, workers only ever write PNGs
+    mne.set_log_level('WARNING')  # Keep the interleaved output of several workers readable
+
+def process_file(pipeline, edf_file, output_directory):
+    ## Process one recording and time it, used by both the serial loop and the process pool
+    print(f"Processing file: {edf_file}")
+    start_time = time.perf_counter()
+    artifacts = pipeline.run(edf_file, output_directory)
+    return {'edf_file': edf_file, 'success': artifacts is not None, 'artifacts': artifacts or [],
+            'seconds': time.perf_counter() - start_time, 'stages': pipeline.metrics.stages,
+            'features': pipeline.features if artifacts is not None else []}
+
+def report_batch(results, wall_time, n_workers, skipped=()):
+    ## Summarize the batch: which files failed, where the time went and, for parallel runs, a rough speedup estimate
+    succeeded = [result for result in results if result['success']]
+    failed = [result for result in results if not result['success']]
+    summed_time = sum(result['seconds'] for result in results)  # Measured while the workers competed for cores and disk
+    print(f"Processed {len(results)} files: {len(succeeded)} succeeded, {len(failed)} failed")
+    if skipped:
+        print(f"Skipped {len(skipped)} files whose outputs were already complete")
+    for result in failed:
+        print(f"    FAILED: {result['edf_file']}")
+    stage_totals = {}
+    for result in results:
+        for stage, entry in (result.get('stages') or {}).items():
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + entry['wall_seconds']
+    if stage_totals:
+        print('Time per stage: ' + ', '.join(f"{stage} {seconds:.1f}s" for stage, seconds in stage_totals.items()))
+    print(f"Wall-clock time: {wall_time:.1f}s, summed per-file time: {summed_time:.1f}s")
+    if results and n_workers > 1 and wall_time > 0:  # Nothing to estimate when an incremental run skipped every file
+        # Only an estimate: the per-file times were measured under contention (and with mne_n_jobs per worker), so they
+        # are longer than the serial loop would take and the ratio overstates the speedup. Time an n_workers = 1 run to compare
+        print(f"Estimated speedup: {summed_time / wall_time:.2f}x with {n_workers} workers (summed per-file time / wall-clock time, an upper bound)")
+
+def select_incremental(edf_files, parent_directory, output_directory, manifest, params_hash):
+    ## Split the EDFs into those that need processing and those whose outputs are already complete
+    todo, skipped = [], []
+    for edf_file in edf_files:
+        entry = manifest.get(manifest_key(edf_file, parent_directory))
+        try:
+            complete = is_complete(entry, edf_file, params_hash, output_directory)
+        except Exception as e:  # Unreadable file, let the normal processing report it
+            print(f"Could not check {edf_file}: {e}")
+            complete = False
+        (skipped if complete else todo).append(edf_file)
+    for edf_file in skipped:
+        print(f"Up to date, skipping: {edf_file}")
+    return todo, skipped
+
+def run_batch(pipeline, parent_directory, output_directory, n_workers=1):
+    ## Every EDF under parent_directory through the pipeline, n_workers recordings at a time
+    edf_files = find_edf_files(parent_directory)  # Grab EDF files
+    results = []
+    skipped = []
+    batch_start = time.perf_counter()
+
+    if pipeline.incremental:  # Only recordings that are new, changed, incomplete or processed with other settings
+        manifest_file = manifest_path(output_directory)
+        manifest = load_manifest(manifest_file)
+        params_hash = settings_hash(pipeline.output_settings())
+        edf_files, skipped = select_incremental(edf_files, parent_directory, output_directory, manifest, params_hash)
+        if pipeline.save_features:  # Outputs complete but no rows in the feature table (e.g. it was deleted), process them again
+            in_table = recordings_in_table(output_directory)
+            missing = [edf_file for edf_file in skipped if os.path.basename(edf_file) not in in_table]
+            edf_files, skipped = edf_files + missing, [edf_file for edf_file in skipped if edf_file not in missing]
+
+    run_id = None
+    if pipeline.catalog_path:
+        try:
+            run_id = register_run(pipeline.catalog_path, output_directory, settings_hash(pipeline.output_settings()), pipeline.output_settings())
+        except Exception as e:  # The outputs matter more than their catalog
+            print(f"Could not open the artifact catalog {pipeline.catalog_path}: {e}")
+
+    def record(result):
+        ## Keep the result, catalog its artifacts and, in incremental mode, update the manifest straight away so an interrupted run keeps its progress
+        results.append(result)
+        if run_id is not None:
+            try:  # A failed recording leaves no rows behind
+                record_artifacts(pipeline.catalog_path, run_id, output_directory, result['edf_file'], result['artifacts'] if result['success'] else [])
+            except Exception as e:
+                print(f"Could not catalog {result['edf_file']}: {e}")
+        if not pipeline.incremental:
+            return
+        key = manifest_key(result['edf_file'], parent_directory)
+        if result['success']:
+            manifest[key] = make_entry(result['edf_file'], params_hash, result['artifacts'], output_directory, result['seconds'])
+        else:
+            manifest.pop(key, None)  # A failed rerun must not leave the old entry claiming the outputs are complete
+        save_manifest(manifest, manifest_file)
+
+    if n_workers > 1 and len(edf_files) > 1:  # Fan recordings out to a pool of worker processes
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(edf_files)), initializer=init_worker) as executor:
+            futures = {executor.submit(process_file, pipeline, edf_file, output_directory): edf_file for edf_file in edf_files}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:  # The worker itself died (out of memory, killed, etc.)
+                    print(f"Worker crashed on {futures[future]}: {e}")
+                    result = {'edf_file': futures[future], 'success': False, 'artifacts': [], 'seconds': 0.0, 'stages': {}, 'features': []}
+                print(f"Finished {result['edf_file']} in {result['seconds']:.1f}s ({'ok' if result['success'] else 'failed'})")
+                record(result)
+    else:
+        for edf_file in edf_files:  # Process EDF files one at a time
+            record(process_file(pipeline, edf_file, output_directory))
+
+    wall_time = time.perf_counter() - batch_start
+    report_batch(results, wall_time, n_workers, skipped)
+    if results:
+        write_run_report(results, output_directory, wall_time, {**pipeline.output_settings(), 'n_workers': n_workers})
+        if pipeline.save_features:
+            feature_table_path = save_feature_table(results, output_directory, pipeline.feature_table_format, keep=skipped)
+            if run_id is not None and feature_table_path is not None:
+                try:
+                    record_artifacts(pipeline.catalog_path, run_id, output_directory, None, [{'kind': 'feature_table', 'path': feature_table_path}])
+                except Exception as e:
+                    print(f"Could not catalog {feature_table_path}: {e}")
+    return results
@@ -0,0 +1,89 @@
+import numpy as np
+import mne  # The main eeg package / library
+from band_power import brain_waves, brain_lobes, stat_names, event_band_features  # Vectorized band / lobe statistics
+
+## Per-event spectra on disk.
+# The .npz files hold the PSD in float32 together with the band / lobe statistics computed from it (band_power.py), so downstream
+# analysis (statistics, combined figures, ML features) can load them instead of recomputing Welch.
+
+def save_event_spectrum(spectrum, path, features=None, **metadata):
+    ## Write one event's spectrum, extra keyword arguments (event name, start, stop...) are stored alongside it
+    # features is event_band_features() of the spectrum when the caller already has it
+    if path.endswith('.h5'):
+        spectrum.save(path, overwrite=True, verbose=False)  # MNE's own format, needs h5io
+    else:
+        data = spectrum.get_data()
+        features = features or event_band_features(data, spectrum.freqs, spectrum.ch_names)
+        np.savez_compressed(
+            path,
+            data=data.astype(np.float32),
+            freqs=spectrum.freqs,
+            ch_names=np.array(spectrum.ch_names),
+            band_names=np.array(list(brain_waves)),
+            stat_names=np.array(stat_names),
+            lobe_names=np.array(list(brain_lobes)),
+            band_powers=features['band_powers'].astype(np.float32),  # (n_channels, n_bands)
+            band_statistics=features['band_statistics'].astype(np.float32),  # (n_bands, n_channels, n_stats)
+            lobe_band_powers=features['lobe_band_powers'].astype(np.float32),  # (n_lobes, n_bands)
+            **{key: np.asarray(value) for key, value in metadata.items()}
+            )
+    print(f"Saved spectrum to {path}")
+
+def load_event_spectrum(path):
+    ## .h5 files come back as an MNE Spectrum, .npz files as a plain dictionary of arrays
+    if path.endswith('.h5'):
+        return mne.time_frequency.read_spectrum(path)
+    with np.load(path) as stored:
+        return {key: stored[key] for key in stored.files}
+
+## Event segmentation:
+# Instead of copying the whole cleaned recording and cropping it once per event, every event window is read
+# straight out of the recording (only the window is copied), the equal-length windows are stacked into one
+# (n_events, n_channels, n_times) array and all their spectra come out of a single Welch call. Their band / lobe powers are
+# computed in one go from the stacked (n_events, n_channels, n_freqs) spectra of that call as well.
+
+def event_windows(samples, raw, offset, length):
+    ## [start, stop) sample indices of the window of every event sample (counted from the first sample of the data),
+    # clipped to the end of the recording. None marks an event whose window would start after the recording ends
+    sfreq = raw.info['sfreq']
+    n_window = int(round(length * sfreq)) + 1  # +1 matches crop(tmin, tmax), which includes tmax
+    windows = []
+    for sample in samples:
+        start = int(sample) + int(round(offset * sfreq))
+        windows.append((start, min(start + n_window, raw.n_times)) if start < raw.n_times - 1 else None)
+    return windows
+
+def segment_events(raw, windows, picks):
+    ## Stack equal-length windows into one (n_events, n_channels, n_times) array
+    return np.stack([raw.get_data(picks=picks, start=start, stop=stop) for start, stop in windows])
+
+def compute_event_spectra(raw, windows, picks, fmin=1, fmax=40, n_jobs=1):
+    ## (one Spectrum per window, its event_band_features()) with None where the window is None, computed with as few
+    # Welch and band-power calls as possible
+    info = mne.pick_info(raw.info, mne.pick_channels(raw.ch_names, picks, ordered=True))
+    spectra = [None] * len(windows)
+    features = [None] * len(windows)
+    lengths = {}  # Window length -> indices of the events with that length (all but a shortened last one share one)
+    for i, window in enumerate(windows):
+        if window is not None:
+            lengths.setdefault(window[1] - window[0], []).append(i)
+    for n_times, indices in lengths.items():
+        data = segment_events(raw, [windows[i] for i in indices], picks)
+        epochs_spectrum = mne.EpochsArray(data, info, verbose=False).compute_psd(
+            method='welch',
+            fmin=fmin,
+            fmax=fmax,
+            n_fft=min(n_times, 2048),  # Same default Raw.compute_psd uses, so the spectra match the per-event version
+            n_jobs=n_jobs,
+            verbose=False,
+            )
+        group_features = event_band_features(epochs_spectrum.get_data(), epochs_spectrum.freqs, epochs_spectrum.ch_names)  # Leading axis is the event
+        for k, i in enumerate(indices):
+            spectra[i] = epochs_spectrum[k].average()
+            features[i] = {key: value[k] for key, value in group_features.items()}
+    return spectra, features
+
+def event_raw(raw, window):
+    ## A small Raw holding only one event window, for the few consumers that need an MNE object (e.g. ICA overlays)
+    start, stop = window
+    return mne.io.RawArray(raw.get_data(start=start, stop=stop), raw.info, first_samp=raw.first_samp + start, verbose=False)
@@ -0,0 +1,105 @@
+import re  # Precompiled description patterns
+import numpy as np
+
+## Event table / annotation parser:
+# mne.events_from_annotations gives an (n_events, 3) array plus a description -> id dictionary, and the scripts looked every
+# name up with list(event_dict.keys())[list(event_dict.values()).index(event_id)], which rebuilds two lists and scans them
+# for every event. Instead raw.annotations are turned straight into a columnar table (parse_annotations): every DISTINCT
+# description is parsed once and broadcast to the annotations that use it. recording_event_table() keeps the annotations
+# mne.events_from_annotations would turn into events, at the same samples, and event_rows() hands out the selected rows.
+
+# Example description:
+# videos\1 excited\1 motorsports\kenMiles.mp4,videos\1 excited\1 motorsports\kenMiles.mp4,-1,1
+#   name: videos\1 excited\1 motorsports\kenMiles.mp4   video: kenMiles   emotion: excited   category: 1
+
+# videos\<category> <emotion>\...\<video>.mp4, either slash works
+video_pattern = re.compile(r'^[^\\/]*[\\/](?P<category>\d+)\s+(?P<emotion>[^\\/]+)[\\/](?:.*[\\/])?(?P<video>[^\\/]+)\.(?:mp4|mkv)$')
+# Any other path ending in a video file, e.g. a neutral video outside the emotion folders
+video_name_pattern = re.compile(r'(?:^|[\\/])(?P<video>[^\\/]+)\.(?:mp4|mkv)$')
+# What mne.events_from_annotations keeps when no regexp is given
+default_event_pattern = re.compile(r'^(?![Bb][Aa][Dd]|[Ee][Dd][Gg][Ee]).*$')
+
+def parse_description(description):
+    ## Split one annotation description into its parts, non-video events (e.g. rating) only get a name
+    name = description.split(',', 1)[0]
+    video, emotion, category = '', '', -1
+    match = video_pattern.match(name)
+    if match:
+        video, emotion, category = match['video'], match['emotion'], int(match['category'])
+    else:
+        match = video_name_pattern.search(name)
+        if match:
+            video = match['video']
+    # label is what goes into titles and filenames: the video name, or the event name for everything else
+    return {'name': name, 'label': video or name, 'video': video, 'emotion': emotion, 'category': category}
+
+def parse_annotations(annotations, end_of_file, onset=None):
+    ## Columnar table of raw.annotations, one numpy array per column, in a single pass
+    # Each distinct description is parsed once and then broadcast to every annotation that uses it
+    # onset replaces annotations.onset, e.g. with seconds from the first sample of the data
+    descriptions = np.array([str(description) for description in annotations.description], dtype=str)  # Plain fixed-width strings whatever numpy string type MNE uses
+    onset = np.asarray(annotations.onset if onset is None else onset, dtype=float)
+    unique_descriptions, inverse = np.unique(descriptions, return_inverse=True)
+    parsed = [parse_description(description) for description in unique_descriptions]
+    table = {key: np.array([row[key] for row in parsed])[inverse] for key in ('name', 'label', 'video', 'emotion', 'category')}
+    next_onset = np.append(onset[1:], end_of_file)  # The last annotation runs to the end of the recording
+    table.update({
+        'description': descriptions,
+        'onset': onset,
+        'next_onset': next_onset,
+        'duration': next_onset - onset,
+        'next_label': np.append(table['label'][1:], 'End of file')[:len(onset)],
+        'next_name': np.append(table['name'][1:], 'End of file')[:len(onset)],
+    })
+    return table
+
+def recording_event_table(raw):
+    ## parse_annotations() of the annotations mne.events_from_annotations turns into events (all but BAD / EDGE ones), with
+    # 'sample' the event's sample (counted from the first sample of the data, rounded the same way) and onsets in seconds from there
+    annotations = raw.annotations
+    annotations = annotations[[i for i, description in enumerate(annotations.description) if default_event_pattern.match(description)]]
+    samples = raw.time_as_index(annotations.onset, use_rounding=True, origin=annotations.orig_time)
+    if annotations.orig_time is None:  # Then those already count the samples before the data, like the events do
+        samples = samples - raw.first_samp
+    table = parse_annotations(annotations, raw.times[-1], samples / raw.info['sfreq'])
+    table['sample'] = samples
+    return table
+
+def select_events(table, regexp=None):
+    ## Indices of the rows whose full description matches regexp, the selection mne.events_from_annotations(regexp=...) makes
+    if regexp is None:
+        return np.arange(len(table['onset']))
+    pattern = re.compile(regexp)
+    selected = np.flatnonzero([pattern.match(description) is not None for description in table['description']])
+    if len(selected) == 0:
+        raise ValueError("Could not find any of the events you specified.")
+    return selected
+
+def event_rows(table, indices):
+    ## One dictionary of plain Python values per selected row: what the event is, when it starts and stops, what follows it
+    return [{
+        'index': int(i),
+        **{key: table[key][i].item() for key in ('name', 'label', 'video', 'emotion', 'category', 'onset', 'duration')},
+        'stop_event_name': table['next_name'][i].item(),
+        'stop': table['next_onset'][i].item(),
+        } for i in indices]
+
+if __name__ == '__main__':
+    # Check the parser against the example documented in split_files_for_every_event.py
+    import mne
+    example = r'videos\1 excited\1 motorsports\kenMiles.mp4,videos\1 excited\1 motorsports\kenMiles.mp4,-1,1'
+    table = parse_annotations(mne.Annotations([95.373119, 163.744559], [0, 0], [example, 'rating']), 200.0)
+    assert table['video'][0] == 'kenMiles' and table['emotion'][0] == 'excited' and table['category'][0] == 1
+    assert table['next_label'][0] == 'rating' and abs(table['duration'][0] - 68.37144) < 1e-6
+    assert table['label'][1] == 'rating' and table['next_label'][1] == 'End of file' and table['category'][1] == -1
+    # Same events and samples as mne.events_from_annotations, BAD annotations dropped, on a recording that does not start at 0
+    for meas_date in (None, 1e9):
+        raw = mne.io.RawArray(np.zeros((1, 128 * 300)), mne.create_info(1, 128, 'eeg'), first_samp=640, verbose=False)
+        raw.set_meas_date(meas_date)
+        raw.set_annotations(mne.Annotations([20.003, 50, 60.5], [0, 0, 0], [example, 'BAD_blink', 'rating'], orig_time=raw.info['meas_date']))
+        events, _ = mne.events_from_annotations(raw, verbose=False)
+        table = recording_event_table(raw)
+        assert list(table['sample'] + raw.first_samp) == list(events[:, 0]) and list(table['label']) == ['kenMiles', 'rating']
+    rows = event_rows(table, select_events(table, '^(?=.*videos)'))
+    assert len(rows) == 1 and rows[0]['stop_event_name'] == 'rating' and rows[0]['stop'] == table['onset'][1] and type(rows[0]['category']) is int
+    print('Annotation parser OK')
@@ -0,0 +1,117 @@
+import os  # Handy OS functions, explore file directory, etc.
+import pandas as pd  # Columnar table, written as Parquet / HDF5 / CSV
+from band_power import brain_waves, brain_lobes  # Column names of the band / lobe powers
+
+## Per-run feature table:
+# Instead of reloading every event FIF and recomputing its spectrum, the ML side reads one table per run with one row per
+# recording x event: what the event is (video, emotion, category), when and how long it was analysed, which ICA
+# components were removed, the mean band power of every channel and the mean band power of every lobe.
+# Every recording hands its rows back with its result (see EEGPipeline.run), run_batch() writes them all in one go.
+# Parquet needs pyarrow (or fastparquet) and HDF5 needs PyTables, whichever is missing the next format is tried and CSV always works.
+
+feature_table_name = 'features'
+feature_table_extensions = {'parquet': '.parquet', 'hdf5': '.h5', 'csv': '.csv'}
+
+def feature_column(prefix, band):
+    ## e.g. power_Fz_Beta_Low, lobe_Frontal_Alpha
+    return f"{prefix}_{band.replace(' ', '_')}"
+
+def component_list(indices):
+    ## ICA component indices as '0,3', so the column is a plain string in every format
+    return ','.join(str(index) for index in sorted(set(indices or [])))
+
+def ica_metadata(ica):
+    ## Which components were removed and why, find_bads_eog / find_bads_muscle leave their picks in ica.labels_
+    return {
+        'ica_method': ica.method,
+        'ica_n_components': ica.n_components_,
+        'ica_excluded': component_list(ica.exclude),
+        'ica_n_excluded': len(ica.exclude),
+        'ica_eog': component_list(ica.labels_.get('eog')),
+        'ica_muscle': component_list(ica.labels_.get('muscle')),
+        }
+
+def event_feature_row(edf_file, epoch, event, event_name, start, stop, features, ch_names, ica_columns):
+    ## One row of the table, features is event_band_features() of the event's spectrum
+    row = {
+        'subject': os.path.basename(edf_file)[:6],  # Same as the output subfolder
+        'edf_file': os.path.basename(edf_file),
+        'epoch': epoch,
+        'event_name': event_name,
+        'name': event['name'],
+        'video': event['video'],
+        'emotion': event['emotion'],
+        'category': event['category'],
+        'onset': event['onset'],
+        'start': start,
+        'stop': stop,
+        'duration': stop - start,
+        **ica_columns,
+        }
+    for c, channel in enumerate(ch_names):
+        for b, band in enumerate(brain_waves):
+            row[feature_column(f'power_{channel}', band)] = float(features['band_powers'][c, b])
+    for l, lobe in enumerate(brain_lobes):
+        for b, band in enumerate(brain_waves):
+            row[feature_column(f'lobe_{lobe}', band)] = float(features['lobe_band_powers'][l, b])
+    return row
+
+def find_feature_table(output_directory):
+    ## Path of the table written by an earlier run into output_directory, None when there is none
+    for extension in feature_table_extensions.values():
+        path = os.path.join(output_directory, feature_table_name + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+def read_feature_table(path):
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    if path.endswith('.h5'):
+        return pd.read_hdf(path, key=feature_table_name)
+    return pd.read_csv(path, keep_default_na=False, dtype={'subject': str, 'edf_file': str, 'name': str, 'video': str, 'emotion': str, 'ica_excluded': str, 'ica_eog': str, 'ica_muscle': str})
+
+def write_feature_table(table, output_directory, table_format='parquet'):
+    ## Write the table in table_format, falling back to the formats after it when a writer is not installed, returns the path
+    formats = list(feature_table_extensions)
+    if table_format not in formats:
+        raise ValueError(f"Unknown feature table format {table_format!r}, use one of {', '.join(formats)}")
+    for fmt in formats[formats.index(table_format):]:
+        path = os.path.join(output_directory, feature_table_name + feature_table_extensions[fmt])
+        try:
+            if fmt == 'parquet':
+                table.to_parquet(path, index=False)
+            elif fmt == 'hdf5':
+                table.to_hdf(path, key=feature_table_name, mode='w', format='table')
+            else:
+                table.to_csv(path, index=False)
+        except ImportError as e:
+            print(f"Cannot write {fmt} ({e}), trying the next format")
+            continue
+        # Only one table per folder, so a rerun that fell back to another format does not leave a stale one behind
+        for other in feature_table_extensions.values():
+            other_path = os.path.join(output_directory, feature_table_name + other)
+            if other_path != path and os.path.exists(other_path):
+                os.remove(other_path)
+        print(f"Saved feature table ({len(table)} events, {len(table.columns)} columns) to {path}")
+        return path
+
+def save_feature_table(results, output_directory, table_format='parquet', keep=()):
+    ## Rows of every successful recording, plus the rows of the recordings in keep (incremental reruns) from the existing table
+    frames = []
+    previous_path = find_feature_table(output_directory)
+    if keep and previous_path is not None:
+        previous = read_feature_table(previous_path)
+        frames.append(previous[previous['edf_file'].isin([os.path.basename(edf_file) for edf_file in keep])])
+    rows = [row for result in results if result['success'] for row in result.get('features') or []]
+    if rows:
+        frames.append(pd.DataFrame(rows))
+    if not frames:
+        return None
+    table = pd.concat(frames, ignore_index=True).sort_values(['subject', 'edf_file', 'epoch'], kind='stable', ignore_index=True)
+    return write_feature_table(table, output_directory, table_format)
+
+def recordings_in_table(output_directory):
+    ## Base names of the recordings that have rows in the existing table
+    path = find_feature_table(output_directory)
+    return set() if path is None else set(read_feature_table(path)['edf_file'])
@@ -0,0 +1,98 @@
+import numpy as np
+from scipy.signal import find_peaks  # Local GFP maxima
+
+## Streaming Global Field Power:
+# gfp_tests.ipynb takes data, times = raw[:, :] and np.std(data, axis=0), which holds the whole session in float64 plus a
+# temporary of the same size, and builds preloaded mne.Epochs over the whole recording just to average the GFP of 3 s windows.
+# GFP is the standard deviation across channels at every sample, so every sample is independent of the others: here the
+# cleaned recording is read chunk_seconds at a time and only the GFP itself (one float32 per sample) is kept.
+# Windowed averages, the notebook's average window profile and the peaks per event all come from that one trace.
+
+def stream_gfp(raw, picks, chunk_seconds=60):
+    ## GFP of every sample (float32, same units as the data), reading at most chunk_seconds of picks at a time
+    chunk = max(1, int(round(chunk_seconds * raw.info['sfreq'])))
+    gfp = np.empty(raw.n_times, dtype=np.float32)
+    for start in range(0, raw.n_times, chunk):
+        stop = min(start + chunk, raw.n_times)
+        gfp[start:stop] = raw.get_data(picks=picks, start=start, stop=stop).std(axis=0)
+    return gfp
+
+def windowed_gfp(gfp, sfreq, window_seconds):
+    ## (mean GFP of every full window, mean GFP at every sample of a window over all windows)
+    # The second one is what gfp_tests.ipynb plots (without its per-epoch detrending)
+    n_window = int(round(window_seconds * sfreq))
+    n_windows = len(gfp) // n_window
+    if n_windows == 0:
+        return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.float32)
+    windows = gfp[:n_windows * n_window].reshape(n_windows, n_window)  # A view, nothing is copied
+    return windows.mean(axis=1, dtype=np.float64).astype(np.float32), windows.mean(axis=0, dtype=np.float64).astype(np.float32)
+
+def gfp_peaks(gfp, min_distance=1):
+    ## Sample indices of the local GFP maxima
+    peaks, _ = find_peaks(gfp, distance=max(1, min_distance))
+    return peaks
+
+def event_gfp_statistics(gfp, peaks, windows, sfreq):
+    ## Mean, std and max GFP, number of peaks, peaks per second and mean GFP at the peaks of every [start, stop) window
+    # None windows (events starting after the recording ends) get NaN and no peaks
+    names = ['mean', 'std', 'max', 'n_peaks', 'peak_rate', 'peak_mean']
+    statistics = np.full((len(windows), len(names)), np.nan)
+    peak_event = np.full(len(peaks), -1)  # Which event every peak falls in, -1 for none
+    for i, window in enumerate(windows):
+        if window is None:
+            continue
+        start, stop = window
+        segment = gfp[start:stop]
+        first, last = np.searchsorted(peaks, [start, stop])
+        peak_event[first:last] = i
+        statistics[i] = [
+            segment.mean(dtype=np.float64),
+            segment.std(dtype=np.float64),
+            segment.max(),
+            last - first,
+            (last - first) / ((stop - start) / sfreq),
+            gfp[peaks[first:last]].mean(dtype=np.float64) if last > first else np.nan,
+            ]
+    return names, statistics, peak_event
+
+def save_gfp(path, gfp, sfreq, windows, event_names, window_seconds=3, min_peak_distance=1):
+    ## Everything GFP of one recording in one .npz, returns the per-event statistics
+    window_means, window_profile = windowed_gfp(gfp, sfreq, window_seconds)
+    peaks = gfp_peaks(gfp, min_peak_distance)
+    statistic_names, statistics, peak_event = event_gfp_statistics(gfp, peaks, windows, sfreq)
+    np.savez_compressed(
+        path,
+        gfp=gfp,
+        sfreq=sfreq,
+        window_seconds=window_seconds,
+        window_gfp=window_means,  # (n_windows,)
+        window_profile=window_profile,  # (n_window_samples,)
+        peaks=peaks,  # Sample indices
+        peak_event=peak_event,  # Event index of every peak, -1 outside the events
+        event_names=np.array(event_names),
+        event_windows=np.array([window if window is not None else (-1, -1) for window in windows]).reshape(-1, 2),
+        statistic_names=np.array(statistic_names),
+        event_statistics=statistics,  # (n_events, n_statistics)
+        )
+    print(f"Saved GFP to {path}")
+    return statistic_names, statistics
+
+if __name__ == '__main__':
+    # Same numbers as the notebook's whole-session np.std, whatever the chunk size
+    import mne
+    rng = np.random.default_rng(0)
+    sfreq = 128
+    info = mne.create_info(8, sfreq, 'eeg')
+    raw = mne.io.RawArray(rng.standard_normal((8, 1000)) * 1e-5, info, verbose=False)
+    full = np.std(raw.get_data(), axis=0)
+    for chunk_seconds in (0.5, 1.3, 60):
+        assert np.allclose(stream_gfp(raw, None, chunk_seconds), full, rtol=1e-6)
+    gfp = stream_gfp(raw, None, 1)
+    means, profile = windowed_gfp(gfp, sfreq, 3)
+    assert len(means) == 2 and np.isclose(means[1], full[384:768].mean(), rtol=1e-6) and len(profile) == 384
+    peaks = gfp_peaks(gfp)
+    assert all(gfp[p] > gfp[p - 1] and gfp[p] >= gfp[p + 1] for p in peaks)
+    names, statistics, peak_event = event_gfp_statistics(gfp, peaks, [(0, 500), None, (500, 1000)], sfreq)
+    assert statistics[0, names.index('n_peaks')] == np.sum(peaks < 500) and np.isnan(statistics[1]).all()
+    assert np.all(peak_event[peaks >= 500] == 2)
+    print('Streaming GFP OK')
@@ -0,0 +1,110 @@
+import time  # Fit timing
+import numpy as np
+import mne  # The main eeg package / library
+from scipy.optimize import linear_sum_assignment  # Pair up components of two fits
+from event_table import recording_event_table  # Video event spans for the stratified sample
+
+## Sample-budget ICA fitting:
+# ICA only needs a representative sample of the data, not every sample of the session. Instead of fitting on the
+# whole recording, a fixed number of seconds is drawn as evenly spaced segments (one segment = tstep seconds, the
+# same chunks ICA's own reject step works on), optionally shared out equally between the video events so every
+# stimulus is represented, copied into a small Raw and fitted with decimation and peak-to-peak rejection.
+# Fit cost is then bounded by the budget instead of growing with session length.
+
+## ICA backends: setting name -> (MNE method, fit_params)
+ica_methods = {
+    'fastica': ('fastica', None),  # scikit-learn, MNE's default
+    'picard': ('picard', None),  # Needs python-picard (pip install python-picard), usually converges in far fewer iterations
+    'infomax': ('infomax', None),
+    'infomax-extended': ('infomax', {'extended': True}),  # Also separates sub-Gaussian sources (e.g. line noise)
+}
+
+def ica_method_arguments(method):
+    ## method / fit_params keyword arguments for mne.preprocessing.ICA
+    if method not in ica_methods:
+        raise ValueError(f"Unknown ICA method {method!r}, choose one of {', '.join(ica_methods)}")
+    mne_method, fit_params = ica_methods[method]
+    return {'method': mne_method, 'fit_params': dict(fit_params) if fit_params else None}
+
+def allocate(capacities, total):
+    ## Share total segments out as equally as possible, spans that are too short hand their share to the others
+    quota = [0] * len(capacities)
+    remaining = total
+    open_spans = [i for i, capacity in enumerate(capacities) if capacity > 0]
+    while remaining > 0 and open_spans:
+        share = max(remaining // len(open_spans), 1)
+        for i in list(open_spans):
+            take = min(share, capacities[i] - quota[i], remaining)
+            quota[i] += take
+            remaining -= take
+            if quota[i] == capacities[i]:
+                open_spans.remove(i)
+            if remaining == 0:
+                break
+    return quota
+
+def video_spans(raw):
+    ## [start, stop) samples of every video event, from its marker to the next event
+    table = recording_event_table(raw)
+    sfreq = raw.info['sfreq']
+    videos = np.flatnonzero(table['video'] != '')
+    return [(int(table['sample'][i]), int(round(table['next_onset'][i] * sfreq))) for i in videos]
+
+def budget_segments(raw, budget, segment_seconds, stratify=True):
+    ## [start, stop) samples of the segments to fit on, the whole recording when the budget covers it
+    n_segment = int(round(segment_seconds * raw.info['sfreq']))
+    spans = video_spans(raw) if stratify else []
+    if not spans:  # Not stratified, or no video events: spread the budget over the whole recording
+        spans = [(0, raw.n_times)]
+    capacities = [(stop - start) // n_segment for start, stop in spans]
+    n_budget = int(budget // segment_seconds)
+    if not stratify and n_budget >= sum(capacities):
+        return [(0, raw.n_times)]
+    segments = []
+    for (start, stop), capacity, k in zip(spans, capacities, allocate(capacities, n_budget)):
+        # k evenly spaced segments out of the span's capacity (distinct because k <= capacity)
+        for index in np.floor((np.arange(k) + 0.5) * capacity / max(k, 1)).astype(int):
+            segments.append((start + index * n_segment, start + (index + 1) * n_segment))
+    return segments
+
+def budget_raw(raw, segments, picks):
+    ## Small Raw holding only the chosen segments back to back
+    data = np.concatenate([raw.get_data(picks=picks, start=start, stop=stop) for start, stop in segments], axis=1)
+    info = mne.pick_info(raw.info, mne.pick_channels(raw.ch_names, picks, ordered=True))
+    return mne.io.RawArray(data, info, verbose=False)
+
+def fit_ica(ica, raw, picks, budget=None, decim=None, reject=None, tstep=2.0, stratify=True):
+    ## Fit in place, returns (fit seconds, seconds of data the fit saw)
+    if budget is None:  # Full fit, same as before
+        fit_raw = raw
+        fitted_seconds = raw.n_times / raw.info['sfreq']
+    else:
+        segments = budget_segments(raw, budget, tstep, stratify)
+        fit_raw = budget_raw(raw, segments, picks)
+        fitted_seconds = fit_raw.n_times / fit_raw.info['sfreq']
+    start_time = time.perf_counter()
+    ica.fit(
+        inst = fit_raw,
+        picks = picks,
+        decim = decim,
+        reject = reject,
+        tstep = tstep,
+        verbose = False,
+        )
+    return time.perf_counter() - start_time, fitted_seconds
+
+def component_stability(ica, reference_ica):
+    ## |correlation| of each component's mixing pattern with its best match in reference_ica
+    # The sign and order of ICA components are arbitrary, so they are paired with the Hungarian algorithm
+    patterns = ica.get_components()
+    reference = reference_ica.get_components()
+    n = patterns.shape[1]
+    correlation = np.abs(np.corrcoef(patterns.T, reference.T)[:n, n:])
+    rows, columns = linear_sum_assignment(-correlation)
+    return correlation[rows, columns], columns
+
+def print_stability(correlations, matches, fit_seconds, full_seconds):
+    print(f"Budget fit {fit_seconds:.1f}s vs full fit {full_seconds:.1f}s ({full_seconds / max(fit_seconds, 1e-9):.1f}x faster)")
+    for component, (match, correlation) in enumerate(zip(matches, correlations)):
+        print(f"    ICA{component:03d} <-> full ICA{match:03d}: |r| = {correlation:.3f}")
+    print(f"    Mean |r| {correlations.mean():.3f}, worst {correlations.min():.3f}")
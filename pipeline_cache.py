@@ -0,0 +1,157 @@
+import os  # Handy OS functions, explore file directory, etc.
+import json  # Settings are serialized to JSON before hashing so the key is stable
+import hashlib  # Content hashes for the cache keys
+from datetime import datetime, timezone  # Recording date round trip through the JSON sidecar
+import numpy as np
+import mne  # The main eeg package / library
+
+## On-disk caches for the expensive preprocessing stages.
+# Everything is keyed on a hash of the input file BYTES plus the settings that produced the result,
+# so renaming or moving an EDF keeps its cache entry, while editing it or changing a setting does not.
+
+_file_hashes = {}  # (path, size, mtime) -> hash, so one run never hashes the same EDF twice
+
+def file_hash(path, chunk_size=1 << 20):
+    ## SHA-256 of the file contents, read in 1 MB chunks so large EDFs never sit in memory at once
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    if memo_key not in _file_hashes:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        _file_hashes[memo_key] = digest.hexdigest()
+    return _file_hashes[memo_key]
+
+def settings_hash(settings):
+    ## Stable hash of a dictionary of settings, key order does not matter
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()
+
+def cache_key(edf_file, settings):
+    ## Combine input bytes and settings into one short key
+    return hashlib.sha256((file_hash(edf_file) + settings_hash(settings)).encode()).hexdigest()[:20]
+
+def ica_cache_path(cache_directory, edf_file, settings):
+    ## MNE insists that ICA files end in -ica.fif
+    name = os.path.splitext(os.path.basename(edf_file))[0]
+    return os.path.join(cache_directory, f"{name}_{cache_key(edf_file, settings)}-ica.fif")
+
+def load_cached_ica(path):
+    ## Return the fitted ICA stored at path, or None when it has not been computed yet
+    if not os.path.exists(path):
+        return None
+    try:
+        return mne.preprocessing.read_ica(path, verbose=False)
+    except Exception as e:  # A half-written or corrupt file is treated as a cache miss
+        print(f"Ignoring unreadable ICA cache {path}: {e}")
+        return None
+
+def save_cached_ica(ica, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    ica.save(path, overwrite=True, verbose=False)
+    print(f"Saved fitted ICA to cache {path}")
+
+## Preprocessed-recording cache:
+# The filtered, referenced EEG channels are stored as a float32 .npy array (memory-mappable with np.load(mmap_mode='r'))
+# next to a .json sidecar with everything needed to rebuild the Raw: channel names, sampling rate, recording date,
+# electrode positions, annotations and the filter / reference state (highpass, lowpass, custom_ref_applied, projectors),
+# so a cached Raw writes the same FIFs as a freshly filtered one and ICA sees that it was high-pass filtered. Scripts and notebooks can then skip reading and filtering the EDF entirely.
+
+def preprocessed_cache_path(cache_directory, edf_file, settings):
+    ## Base path of a cache entry, the .npy and .json files are named after it
+    name = os.path.splitext(os.path.basename(edf_file))[0]
+    return os.path.join(cache_directory, f"{name}_{cache_key(edf_file, settings)}_preprocessed")
+
+def save_preprocessed(raw, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    annotations = raw.annotations
+    onset_offset = raw.first_time if annotations.orig_time is not None else 0  # Store onsets relative to the first sample
+    montage = raw.get_montage()
+    positions = montage.get_positions() if montage is not None else None
+    metadata = {
+        'ch_names': raw.ch_names,
+        'sfreq': raw.info['sfreq'],
+        'meas_date': raw.info['meas_date'].isoformat() if raw.info['meas_date'] is not None else None,
+        'ch_pos': {ch: pos.tolist() for ch, pos in positions['ch_pos'].items()} if positions else None,
+        'fiducials': {key: positions[key].tolist() for key in ('nasion', 'lpa', 'rpa') if positions[key] is not None} if positions else None,
+        'onset': (annotations.onset - onset_offset).tolist(),
+        'duration': annotations.duration.tolist(),
+        'description': [str(description) for description in annotations.description],
+        'highpass': raw.info['highpass'],
+        'lowpass': raw.info['lowpass'],
+        'custom_ref_applied': int(raw.info['custom_ref_applied']),
+        'projs': [{
+            'desc': proj['desc'],
+            'kind': int(proj['kind']),
+            'active': bool(proj['active']),
+            'explained_var': proj['explained_var'],
+            'data': {**proj['data'], 'data': np.asarray(proj['data']['data']).tolist()},
+            } for proj in raw.info['projs']],
+    }
+    # Write to temporary files and rename, so a crash or a second process never leaves a half-written entry behind
+    with open(path + '.tmp.npy', 'wb') as f:
+        np.save(f, raw.get_data().astype(np.float32))
+    with open(path + '.tmp.json', 'w') as f:
+        json.dump(metadata, f)
+    os.replace(path + '.tmp.npy', path + '.npy')
+    os.replace(path + '.tmp.json', path + '.json')
+    print(f"Saved preprocessed recording to cache {path}.npy")
+
+def load_preprocessed_array(path):
+    ## (memory-mapped float32 array of shape (n_channels, n_times), metadata), or (None, None) on a cache miss
+    if not (os.path.exists(path + '.npy') and os.path.exists(path + '.json')):
+        return None, None
+    with open(path + '.json') as f:
+        metadata = json.load(f)
+    if 'highpass' not in metadata:  # Written before the filter state was stored, rebuilding it would claim unfiltered data
+        return None, None
+    return np.load(path + '.npy', mmap_mode='r'), metadata
+
+def load_preprocessed(path):
+    ## Rebuild the preprocessed Raw from the cache, or None on a cache miss
+    data, metadata = load_preprocessed_array(path)
+    if data is None:
+        return None
+    info = mne.create_info(metadata['ch_names'], metadata['sfreq'], 'eeg')
+    raw = mne.io.RawArray(data, info, verbose=False)
+    if metadata['meas_date'] is not None:
+        raw.set_meas_date(datetime.fromisoformat(metadata['meas_date']))
+    if metadata['ch_pos']:
+        raw.set_montage(mne.channels.make_dig_montage(
+            ch_pos={ch: np.array(pos) for ch, pos in metadata['ch_pos'].items()},
+            coord_frame='head',
+            **{key: np.array(pos) for key, pos in metadata['fiducials'].items()}
+            ), on_missing='ignore')
+    raw.set_annotations(mne.Annotations(metadata['onset'], metadata['duration'], metadata['description']))
+    with raw.info._unlock():  # Filter and reference state of the preprocessed recording, RawArray starts unfiltered
+        raw.info['highpass'] = metadata['highpass']
+        raw.info['lowpass'] = metadata['lowpass']
+        raw.info['custom_ref_applied'] = metadata['custom_ref_applied']
+        raw.info['projs'] = [mne.Projection(**{**proj, 'data': {**proj['data'], 'data': np.array(proj['data']['data'])}}) for proj in metadata['projs']]
+    return raw
+
+if __name__ == '__main__':
+    # Round trip: the cached Raw must carry the same data (to float32 precision) and the same filter / reference state
+    import tempfile
+    for projection in (False, True):
+        rng = np.random.default_rng(0)
+        info = mne.create_info(['Fz', 'Cz', 'Pz', 'Oz', 'C3', 'C4'], 128, 'eeg')
+        fresh = mne.io.RawArray(rng.standard_normal((6, 128 * 20)) * 1e-5, info, verbose=False)
+        fresh.set_meas_date(datetime(2024, 1, 1, 12, 0, 0, tzinfo=timezone.utc))
+        fresh.set_montage(mne.channels.make_standard_montage('standard_1020'), on_missing='ignore')
+        fresh.set_annotations(mne.Annotations([2.0, 9.5], [0, 0], ['videos\\1 excited\\a\\clip.mp4', 'rating']))
+        fresh.set_eeg_reference('average', projection=projection, verbose=False)
+        fresh.filter(1.0, 40.0, verbose=False)
+        path = os.path.join(tempfile.mkdtemp(), 'recording_preprocessed')
+        save_preprocessed(fresh, path)
+        cached = load_preprocessed(path)
+        for key in ('sfreq', 'highpass', 'lowpass', 'custom_ref_applied', 'meas_date', 'ch_names'):
+            assert cached.info[key] == fresh.info[key], (key, cached.info[key], fresh.info[key])
+        assert len(cached.info['projs']) == len(fresh.info['projs'])
+        for cached_proj, fresh_proj in zip(cached.info['projs'], fresh.info['projs']):
+            assert cached_proj['desc'] == fresh_proj['desc'] and cached_proj['active'] == fresh_proj['active']
+            assert np.allclose(cached_proj['data']['data'], fresh_proj['data']['data'])
+        assert np.allclose(cached.get_data(), fresh.get_data(), rtol=1e-6, atol=1e-12)
+        assert list(cached.annotations.description) == list(fresh.annotations.description)
+        assert np.allclose(cached.annotations.onset, fresh.annotations.onset)
+    print('Preprocessed cache OK')
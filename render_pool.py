@@ -0,0 +1,142 @@
+import time  # Drawing time, measured where the figure is drawn
+import matplotlib  # Workers switch to the headless Agg backend
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED  # Pool of rendering processes
+from multiprocessing.util import Finalize  # Shut the shared pool down when its process exits, also inside pool workers
+import mne  # The main eeg package / library
+
+## Rendering pool:
+# Drawing and saving figures is CPU-bound and used to run inline between the numerical steps of every event.
+# The main process now hands PURE DATA (the spectrum array, its frequencies, the channel info with positions, a title
+# and the output path) to a few Agg worker processes and carries on computing. At most max_pending jobs are queued,
+# submit() waits for one to finish before adding more, so memory stays capped however many events a recording has.
+# Starting render processes is not free (with spawn, the default on Windows, each one imports mne and matplotlib again), so
+# every process gets ONE pool from shared_render_pool() and keeps it for all the recordings it handles: a run uses
+# n_workers * (1 + render_workers) processes once, instead of render_workers new ones per recording.
+# Every job is timed inside the process that draws it (timed_call) and the times come back with the result, so the drawing
+# itself can be reported next to the time the submitting process spent waiting for the pool.
+
+def init_render_worker():
+    matplotlib.use('Agg')  # Headless backend, workers only ever write PNGs
+
+def timed_call(function, *args, **kwargs):
+    ## (function's result, wall seconds, CPU seconds), measured in the process that runs it
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+def render_psd(data, freqs, info, path, dB=True):
+    ## PSD line plot of one event
+    import matplotlib.pyplot as plt
+    spectrum = mne.time_frequency.SpectrumArray(data, info, freqs, verbose=False)
+    psd_fig = spectrum.plot(dB=dB, show=False)
+    psd_fig.savefig(path)
+    plt.close(psd_fig)  # Close the figure to free up memory
+    return path
+
+def render_topomap(data, freqs, info, title, path, normalize=True):
+    ## Band topomaps of one event
+    import matplotlib.pyplot as plt
+    spectrum = mne.time_frequency.SpectrumArray(data, info, freqs, verbose=False)
+    topo_fig = spectrum.plot_topomap(
+        ch_type="eeg",
+        normalize=normalize,  #NOTE: KEY!!!
+        sensors=True,
+        # names=None,
+        mask=None,
+        mask_params=None,
+        contours=6,
+        outlines='head',
+        sphere=None,
+        image_interp='cubic', #'nearest' 'linear'
+        extrapolate='auto',
+        border='mean',
+        res=64,
+        size=1,
+        # cmap='RdBu_r',
+        # cmap='viridis',
+        # cmap='plasma',
+        # cmap='inferno',
+        # cmap='magma',
+        # cmap='cividis',
+        cmap='Spectral_r',
+        vlim=(None, None),
+        cnorm=None,
+        axes=None,
+        show=False,
+        )
+    plt.title(f"{title}")
+    topo_fig.savefig(path)
+    plt.close(topo_fig)  # Close the topo_figure to free up memory
+    return path
+
+class RenderPool:
+    ## Bounded pool of rendering processes, n_workers = 0 renders inline in the calling process instead
+    def __init__(self, n_workers=2, max_pending=8):
+        self.executor = ProcessPoolExecutor(max_workers=n_workers, initializer=init_render_worker) if n_workers > 0 else None
+        self.max_pending = max_pending
+        self.settings = (n_workers, max_pending)
+        self.pending = set()
+        self.failed = 0
+        self.drawn = {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0}  # Time spent drawing the figures that succeeded
+
+    def submit(self, function, *args, **kwargs):
+        if self.executor is None:
+            self.collect_result(timed_call, function, *args, **kwargs)
+            return
+        while len(self.pending) >= self.max_pending:  # Queue is full, wait for a worker to finish something
+            done, self.pending = wait(self.pending, return_when=FIRST_COMPLETED)
+            self.collect(done)
+        self.pending.add(self.executor.submit(timed_call, function, *args, **kwargs))
+
+    def collect_result(self, function, *args, **kwargs):
+        ## function returns timed_call()'s (path, wall seconds, CPU seconds)
+        try:
+            path, wall_seconds, cpu_seconds = function(*args, **kwargs)
+            self.drawn['calls'] += 1
+            self.drawn['wall_seconds'] += wall_seconds
+            self.drawn['cpu_seconds'] += cpu_seconds
+            print(f"Saved {path}")
+        except Exception as e:
+            self.failed += 1
+            print(f"Rendering failed: {e}")
+
+    def collect(self, futures):
+        for future in futures:
+            self.collect_result(future.result)
+
+    def drain(self):
+        ## Wait for everything queued so far, the workers keep running. Returns how many of those figures failed and the
+        # calls, wall and CPU seconds spent drawing the others
+        if self.executor is not None:
+            self.collect(wait(self.pending)[0])
+            self.pending = set()
+        failed, self.failed = self.failed, 0
+        drawn, self.drawn = self.drawn, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0}
+        return failed, drawn
+
+    def close(self):
+        ## Wait for everything still queued, then stop the workers
+        self.drain()
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+_shared_pool = None  # The RenderPool of this process, see shared_render_pool()
+
+def shared_render_pool(n_workers=2, max_pending=8):
+    ## This process's RenderPool, created on first use and reused for every recording until the process exits
+    global _shared_pool
+    if _shared_pool is None or _shared_pool.settings != (n_workers, max_pending):
+        if _shared_pool is not None:
+            _shared_pool.close()
+        _shared_pool = RenderPool(n_workers, max_pending)
+        # Runs at exit of the main process and of pool workers alike, BEFORE the multiprocessing queues close (their own
+        # finalizers use priority 10), otherwise the stop messages never reach the render processes and the exit hangs
+        Finalize(_shared_pool, _shared_pool.close, exitpriority=20)
+    return _shared_pool
@@ -0,0 +1,65 @@
+import os  # Handy OS functions, explore file directory, etc.
+import json  # The manifest is a plain JSON file next to the outputs
+from datetime import datetime  # When each recording was last completed
+from pipeline_cache import file_hash  # Same content hash the caches use
+
+## Incremental reruns:
+# Every output directory run in incremental mode keeps a manifest.json with one entry per recording:
+#   input_hash   SHA-256 of the EDF bytes (size and mtime are kept too, so unchanged files are not re-hashed)
+#   params_hash  hash of every setting that changes the outputs
+#   artifacts    every file written for the recording, paths relative to the output directory
+# A recording is skipped when its entry matches and every artifact is still on disk, anything else is reprocessed.
+
+manifest_filename = 'manifest.json'
+
+def manifest_path(output_directory):
+    return os.path.join(output_directory, manifest_filename)
+
+def manifest_key(edf_file, parent_directory):
+    ## Recordings are keyed on their path inside the data folder, so the whole tree can be moved
+    return os.path.relpath(edf_file, parent_directory).replace('\\', '/')
+
+def load_manifest(path):
+    ## {recording: entry}, empty when there is no manifest yet or it cannot be read
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except Exception as e:  # A corrupt manifest only costs a full rerun
+        print(f"Ignoring unreadable manifest {path}: {e}")
+        return {}
+
+def save_manifest(manifest, path):
+    ## Write to a temporary file and rename, so an interrupted run never leaves a half-written manifest
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+def input_hash(edf_file, entry=None):
+    ## Content hash of the EDF, reused from the manifest entry when size and mtime have not changed
+    stat = os.stat(edf_file)
+    if entry and entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime:
+        return entry['input_hash']
+    return file_hash(edf_file)
+
+def is_complete(entry, edf_file, params_hash, output_directory):
+    ## True when the recording was processed with the same bytes and settings and all its outputs are still there
+    if not entry or entry.get('params_hash') != params_hash:
+        return False
+    if input_hash(edf_file, entry) != entry.get('input_hash'):
+        return False
+    return all(os.path.exists(os.path.join(output_directory, artifact['path'])) for artifact in entry.get('artifacts', []))
+
+def make_entry(edf_file, params_hash, artifacts, output_directory, seconds):
+    ## Manifest entry for a recording that was just processed successfully
+    stat = os.stat(edf_file)
+    return {
+        'input_hash': file_hash(edf_file),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'params_hash': params_hash,
+        'artifacts': [{**artifact, 'path': os.path.relpath(artifact['path'], output_directory).replace('\\', '/')} for artifact in artifacts],
+        'seconds': seconds,
+        'completed': datetime.now().isoformat(timespec='seconds'),
+        }
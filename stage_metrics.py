@@ -0,0 +1,112 @@
+import os  # Handy OS functions, explore file directory, etc.
+import sys  # ru_maxrss units differ between Linux and macOS
+import csv  # Flat run report, one row per recording and stage
+import json  # Full run report
+import time  # Wall and CPU clocks
+from datetime import datetime  # When the report was written
+try:
+    import resource  # Peak RSS on Linux / macOS
+except ImportError:  # Windows
+    resource = None
+try:
+    import psutil  # Optional, current RSS everywhere and peak working set on Windows
+except ImportError:
+    psutil = None
+
+## Stage instrumentation:
+# Every pipeline stage records, in the process that runs it:
+#   wall_seconds, cpu_seconds  time.perf_counter / time.process_time (this process only)
+#   rss_growth_mb              resident memory after the stage minus before it, the largest of its calls. Memory the stage
+#                              allocates and frees again does not show, so it measures what the stage keeps
+#   process_peak_rss_mb        the PROCESS's peak RSS so far when the stage finished, not the stage's own peak: it only
+#                              tells which stage first pushed the high-water mark up, and pool workers carry it over
+#                              from earlier recordings
+# Stages measured elsewhere (the figures drawn in the render processes) are added with add().
+# run_batch() collects them per recording and writes run_report.json and run_report.csv next to the outputs.
+
+report_columns = ['calls', 'wall_seconds', 'cpu_seconds', 'rss_growth_mb', 'process_peak_rss_mb']
+
+def current_rss_mb():
+    ## Resident memory of this process right now in MB, None when it cannot be measured
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1024 ** 2
+    try:
+        with open('/proc/self/statm') as f:  # Linux: size and resident pages
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+def peak_rss_mb():
+    ## Peak resident memory of this process so far in MB, None when it cannot be measured
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024  # Bytes on macOS, kB on Linux
+    if psutil is not None:
+        memory = psutil.Process().memory_info()
+        return getattr(memory, 'peak_wset', memory.rss) / 1024 ** 2
+    return None
+
+class StageMetrics:
+    ## Accumulates call count, wall time, CPU time, RSS growth and the process's peak RSS per stage name
+    def __init__(self):
+        self.stages = {}
+
+    def entry(self, stage):
+        return self.stages.setdefault(stage, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'rss_growth_mb': None, 'process_peak_rss_mb': None})
+
+    def measure(self, stage, function, *args, **kwargs):
+        rss_start = current_rss_mb()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            wall_seconds, cpu_seconds = time.perf_counter() - wall_start, time.process_time() - cpu_start
+            rss_end = current_rss_mb()
+            entry = self.add(stage, wall_seconds, cpu_seconds)
+            if rss_start is not None and rss_end is not None:
+                entry['rss_growth_mb'] = max(entry['rss_growth_mb'] or 0.0, rss_end - rss_start)
+            entry['process_peak_rss_mb'] = peak_rss_mb()
+
+    def add(self, stage, wall_seconds, cpu_seconds, calls=1):
+        ## Add time measured somewhere else (e.g. inside the render processes) to a stage
+        entry = self.entry(stage)
+        entry['calls'] += calls
+        entry['wall_seconds'] += wall_seconds
+        entry['cpu_seconds'] += cpu_seconds
+        return entry
+
+    def wall_times(self):
+        return {stage: entry['wall_seconds'] for stage, entry in self.stages.items()}
+
+def report_values(entry):
+    ## The report_columns of one stage entry, rounded, '' for what was not measured
+    digits = {'wall_seconds': 4, 'cpu_seconds': 4, 'rss_growth_mb': 1, 'process_peak_rss_mb': 1}
+    values = []
+    for column in report_columns:
+        value = entry.get(column)
+        if value in ('', None):
+            values.append('')
+        else:
+            values.append(round(value, digits[column]) if column in digits else value)
+    return values
+
+def write_run_report(results, output_directory, wall_time, settings=None):
+    ## run_report.json (everything) and run_report.csv (one row per recording and stage) in output_directory
+    report = {
+        'written': datetime.now().isoformat(timespec='seconds'),
+        'wall_seconds': wall_time,
+        'settings': settings or {},
+        'recordings': [{key: result.get(key) for key in ('edf_file', 'success', 'seconds', 'stages')} for result in results],
+        }
+    json_path = os.path.join(output_directory, 'run_report.json')
+    with open(json_path, 'w') as f:
+        json.dump(report, f, indent=1, default=str)
+    csv_path = os.path.join(output_directory, 'run_report.csv')
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['edf_file', 'success', 'stage'] + report_columns)
+        for result in results:
+            for stage, entry in (result.get('stages') or {}).items():
+                writer.writerow([result['edf_file'], result['success'], stage] + report_values(entry))
+    print(f"Saved run report to {json_path} and {csv_path}")
+    return json_path, csv_path
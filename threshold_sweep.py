@@ -0,0 +1,121 @@
+eog_thresholds = [2, 2.5, 3, 3.5, 4, 5] # z-score thresholds to try for find_bads_eog
+muscle_thresholds = [0.4, 0.5, 0.6, 0.7, 0.8] # Thresholds to try for find_bads_muscle
+muscle_n_criteria = 3 # find_bads_muscle compares against threshold ** n_criteria, 3 when the montage has positions
+output_directory = 'threshold_sweeps'
+description = f'eogt_{"-".join(map(str, eog_thresholds))}_mt_{"-".join(map(str, muscle_thresholds))}'
+import os  # Handy OS functions, explore file directory, etc.
+import csv  # Summary table
+import itertools  # Build the threshold grid
+import numpy as np
+import matplotlib.pyplot as plt  # Use as backend when needed
+from datetime import datetime  # To time & date stamp output files as needed
+from scipy.stats import zscore  # Same z-scoring find_bads_eog uses
+import export_all_events as pipeline  # Preprocessing, ICA fitting (and its cache) and the shared settings
+
+## Threshold sweep:
+# Fits ICA once per recording and scores the components for EOG and muscle artifacts once.
+# Every eog_threshold / muscle_threshold combination is then evaluated from the stored score arrays,
+# and the cleaned PSD is only computed once per DISTINCT exclusion set (many combinations exclude the same components).
+
+def find_outliers(scores, threshold, max_iter=2):
+    ## Iterated z-scoring, mirrors what ICA.find_bads_eog does with measure="zscore"
+    mask = np.zeros(len(scores), dtype=bool)
+    for _ in range(max_iter):
+        this_z = np.abs(zscore(np.ma.masked_array(scores, mask)))
+        local_bad = this_z > threshold
+        mask = np.max([mask, local_bad], 0)
+        if not np.any(local_bad):
+            break
+    return np.where(mask)[0]
+
+def eog_exclusions(eog_scores, threshold):
+    ## eog_scores has one row per EOG channel, a component is excluded if it is an outlier for any of them
+    return sorted({int(idx) for channel_scores in eog_scores for idx in find_outliers(channel_scores, threshold)})
+
+def muscle_exclusions(muscle_scores, threshold):
+    return [int(idx) for idx in np.where(muscle_scores > threshold ** muscle_n_criteria)[0]]
+
+def sweep_recording(edf_file, output_directory):
+    raw = pipeline.load_and_preprocess(edf_file)
+    ica = pipeline.fit_or_load_ica(raw, edf_file)
+
+    # Score once, the thresholds passed here only affect the returned indices which we recompute ourselves
+    _, eog_scores = ica.find_bads_eog(raw, ch_name=pipeline.eog_channels, threshold=pipeline.eog_threshold, measure="zscore", verbose=False)
+    _, muscle_scores = ica.find_bads_muscle(inst=raw, threshold=pipeline.muscle_threshold, verbose=False)
+    eog_scores = np.atleast_2d(eog_scores)  # A single EOG channel comes back as a flat array
+
+    rows = []
+    spectra = {}  # Exclusion set -> cleaned spectrum
+    for eog_t, muscle_t in itertools.product(eog_thresholds, muscle_thresholds):
+        eog_indices = eog_exclusions(eog_scores, eog_t)
+        muscle_indices = muscle_exclusions(muscle_scores, muscle_t)
+        excluded = tuple(sorted(set(eog_indices) | set(muscle_indices)))
+        if excluded not in spectra:
+            ica.exclude = list(excluded)
+            raw_clean = ica.apply(raw.copy(), verbose=False)
+            spectra[excluded] = raw_clean.compute_psd(picks=pipeline.eeg_channels, fmin=1, fmax=40, verbose=False)
+        rows.append({
+            'eog_threshold': eog_t,
+            'muscle_threshold': muscle_t,
+            'eog_indices': ' '.join(map(str, eog_indices)),
+            'muscle_indices': ' '.join(map(str, muscle_indices)),
+            'excluded': ' '.join(map(str, excluded)),
+            'n_excluded': len(excluded),
+            'spectrum': exclusion_label(excluded),
+            })
+
+    subfolder_path = os.path.join(output_directory, os.path.basename(edf_file)[:6])
+    os.makedirs(subfolder_path, exist_ok=True)
+    base_name = os.path.basename(edf_file).replace('.edf', '').replace('.bdf', '')
+    save_summary(rows, os.path.join(subfolder_path, f"{base_name}_threshold_sweep.csv"))
+    save_spectra(spectra, os.path.join(subfolder_path, f"{base_name}_threshold_sweep_psds.npz"))
+    plot_spectra(spectra, base_name, os.path.join(subfolder_path, f"{base_name}_threshold_sweep_psds.png"))
+    print(f"Evaluated {len(rows)} threshold combinations ({len(spectra)} distinct exclusion sets) for {edf_file}")
+    return rows
+
+def exclusion_label(excluded):
+    ## Name used for an exclusion set in the .npz file and the plot legend
+    return 'excl_' + ('_'.join(map(str, excluded)) if excluded else 'none')
+
+def save_summary(rows, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Saved threshold sweep summary to {path}")
+
+def save_spectra(spectra, path):
+    ## One array per exclusion set, all sharing the same freqs and channel order
+    first = next(iter(spectra.values()))
+    arrays = {exclusion_label(excluded): spectrum.get_data() for excluded, spectrum in spectra.items()}
+    np.savez_compressed(path, freqs=first.freqs, ch_names=np.array(first.ch_names), **arrays)
+    print(f"Saved cleaned PSDs to {path}")
+
+def plot_spectra(spectra, title, path):
+    ## Channel-averaged PSD of every distinct exclusion set on one axis
+    fig, ax = plt.subplots(figsize=(10, 6))
+    for excluded, spectrum in spectra.items():
+        ax.plot(spectrum.freqs, 10 * np.log10(spectrum.get_data().mean(axis=0)), label=exclusion_label(excluded))
+    ax.set_xlabel('Frequency (Hz)')
+    ax.set_ylabel('Power (dB)')
+    ax.set_title(title)
+    ax.legend(fontsize='small')
+    fig.savefig(path)
+    plt.close(fig)  # Close the figure to free up memory
+
+def main(parent_directory, output_directory):
+    for edf_file in pipeline.find_edf_files(parent_directory):
+        print(f"Sweeping thresholds for: {edf_file}")
+        try:
+            sweep_recording(edf_file, output_directory)
+        except Exception as e:
+            print(f"Error sweeping {edf_file}: {e}")
+
+if __name__ == '__main__':
+    parent_directory = r'emotion_data\103918'
+
+    # Create a timestamped subfolder in the output directory
+    timestamp = datetime.now().strftime('%y%m%d_%H%M%S')
+    timestamped_output_directory = os.path.join(output_directory, pipeline.sanitize_filename(timestamp + description))
+    os.makedirs(timestamped_output_directory, exist_ok=True)
+    main(parent_directory, timestamped_output_directory)
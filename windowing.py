@@ -0,0 +1,101 @@
+import os  # Handy OS functions, explore file directory, etc.
+import numpy as np
+import pandas as pd  # Window table
+from numpy.lib.stride_tricks import sliding_window_view  # Windows as a view, nothing is copied
+from numpy.lib.format import open_memmap  # .npy file written in place and read back memory-mapped
+
+## Fixed-interval windows:
+# split_raw_into_intervals() in menu_tests.ipynb copies the whole recording and crops it once per 2 s interval, and writes
+# a separate FIF for every interval. Here all windows of a recording are one (n_windows, n_channels, n_window) .npy array:
+# the data is read chunk_seconds at a time, the windows of a chunk are a strided view of it (overlapping windows share
+# memory) and are copied straight into the memory-mapped file. Next to it a CSV table says where every window starts and
+# stops and which event it falls in (from the event's onset up to its stop, -1 and no names outside every selected event,
+# e.g. in the rating periods when only the videos are selected), and np.load(path, mmap_mode='r')[i] reads just window i back.
+# Only complete windows are kept, a shorter tail at the end of the recording is dropped so every window has the same shape.
+
+def window_starts(n_times, n_window, step):
+    ## First sample of every complete window
+    return np.arange(0, max(n_times - n_window + 1, 0), step)
+
+def window_view(data, n_window, step):
+    ## (n_windows, n_channels, n_window) strided view of (n_channels, n_times) data
+    return sliding_window_view(data, n_window, axis=-1)[:, ::step].transpose(1, 0, 2)
+
+def window_events(starts, table, sfreq):
+    ## Index into the event table of the event every window starts in, -1 when it starts outside [onset, stop) of every event
+    if len(table) == 0:
+        return np.full(len(starts), -1)
+    onsets = np.array([int(round(event['onset'] * sfreq)) for event in table], dtype=int)
+    stops = np.array([int(round(event['stop'] * sfreq)) for event in table], dtype=int)
+    events = np.searchsorted(onsets, starts, side='right') - 1  # Last event starting at or before the window
+    inside = (events >= 0) & (starts < stops[np.maximum(events, 0)])
+    return np.where(inside, events, -1)
+
+def window_table(starts, n_window, sfreq, table=()):
+    ## One row per window: samples, seconds and the event it starts in
+    events = window_events(starts, table, sfreq)
+    return pd.DataFrame({
+        'window': np.arange(len(starts)),
+        'start_sample': starts,
+        'stop_sample': starts + n_window,
+        'start': starts / sfreq,
+        'stop': (starts + n_window) / sfreq,
+        'event_index': events,
+        'event_name': [table[i]['label'] if i >= 0 else '' for i in events],
+        'video': [table[i]['video'] if i >= 0 else '' for i in events],
+        'emotion': [table[i]['emotion'] if i >= 0 else '' for i in events],
+        })
+
+def write_windows(raw, picks, path, interval=2, overlap=0, table=(), chunk_seconds=60, dtype=np.float32):
+    ## Write every interval-second window (consecutive windows share overlap seconds) to path (.npy) and its table
+    # next to it (same name, .csv), returns the window table
+    sfreq = raw.info['sfreq']
+    n_window = int(round(interval * sfreq))
+    step = n_window - int(round(overlap * sfreq))
+    if step < 1:
+        raise ValueError(f"overlap ({overlap}s) must be shorter than the interval ({interval}s)")
+    starts = window_starts(raw.n_times, n_window, step)
+    n_channels = len(picks) if picks is not None else len(raw.ch_names)
+    windows = open_memmap(path, mode='w+', dtype=dtype, shape=(len(starts), n_channels, n_window))
+    per_chunk = max(1, int(round(chunk_seconds * sfreq)) // step)  # Windows read per pass over the data
+    for first in range(0, len(starts), per_chunk):
+        last = min(first + per_chunk, len(starts))
+        data = raw.get_data(picks=picks, start=starts[first], stop=starts[last - 1] + n_window)
+        windows[first:last] = window_view(data, n_window, step)
+    windows.flush()
+    del windows
+    rows = window_table(starts, n_window, sfreq, table)
+    rows.to_csv(window_table_path(path), index=False)
+    print(f"Saved {len(starts)} windows of {interval}s to {path}")
+    return rows
+
+def window_table_path(path):
+    return os.path.splitext(path)[0] + '.csv'
+
+def load_windows(path):
+    ## (memory-mapped (n_windows, n_channels, n_window) array, window table)
+    return np.load(path, mmap_mode='r'), pd.read_csv(window_table_path(path), keep_default_na=False)
+
+if __name__ == '__main__':
+    # Same samples as the notebook's crop loop, overlapping or not, and whatever the chunk size
+    import tempfile
+    import mne
+    rng = np.random.default_rng(0)
+    sfreq = 128
+    raw = mne.io.RawArray(rng.standard_normal((4, 1000)), mne.create_info(4, sfreq, 'eeg'), verbose=False)
+    table = [{'onset': 1.0, 'stop': 2.5, 'label': 'kenMiles', 'video': 'kenMiles', 'emotion': 'excited'},
+             {'onset': 4.0, 'stop': 5.0, 'label': 'rating', 'video': '', 'emotion': ''}]
+    data = raw.get_data()
+    for overlap, chunk_seconds in ((0, 60), (0, 1), (1.5, 0.7)):
+        path = os.path.join(tempfile.mkdtemp(), 'windows.npy')
+        rows = write_windows(raw, None, path, 2, overlap, table, chunk_seconds)
+        windows, loaded = load_windows(path)
+        step = 256 - int(overlap * sfreq)
+        assert len(windows) == (1000 - 256) // step + 1 == len(loaded)
+        for i, start in enumerate(rows['start_sample']):
+            assert np.allclose(windows[i], data[:, start:start + 256].astype(np.float32))
+    # Windows every 0.5 s: before the first event, in it from 1.0 s up to its stop at 2.5 s, in no event until the rating at
+    # 4.0 s and in none again after its stop at 5.0 s (a selection of events leaves such gaps, e.g. only the videos)
+    assert list(loaded['event_name']) == ['', '', 'kenMiles', 'kenMiles', 'kenMiles', '', '', '', 'rating', 'rating', '', '']
+    assert list(loaded['event_index']) == [-1, -1, 0, 0, 0, -1, -1, -1, 1, 1, -1, -1]
+    print('Windowing OK')